@@ -0,0 +1,234 @@
+"""Synthetic inputs for the benchmarks.
+
+Every corpus is written into a directory and described by a Corpus: the
+template directory, the template and the markdown files to publish. The
+content is generated from a fixed seed, so every run renders the same pages.
+"""
+
+from pathlib import Path
+from random import Random
+from typing import Callable, Dict, List
+
+ATTACHMENTS_FOLDER = "attachments"
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam "
+    "quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo"
+).split()
+
+INVOICE_TEMPLATE = """<html>
+<head>
+<style>
+@page { size: A4; margin: 2cm; }
+body { font-family: sans-serif; font-size: 10pt; }
+.header { display: flex; justify-content: space-between; }
+</style>
+</head>
+<body>
+<section class="header">
+<div><b>{{company}}</b><br>{{address}}<br>{{city}}</div>
+<div>Invoice {{number}}<br>Date: {{date}}<br>Due: {{due}}</div>
+</section>
+<section><b>To:</b> {{client}}<br>{{client_address}}</section>
+<p>Reference: {{reference}}<br>Project: {{project}}<br>PO: {{po_number}}</p>
+<p>VAT: {{vat}}<br>IBAN: {{iban}}<br>BIC: {{bic}}</p>
+<section>{{body}}</section>
+<footer>{{notes}}</footer>
+</body>
+</html>
+"""
+
+MANUAL_TEMPLATE = """<html>
+<head>
+<style>
+@page { size: A4; margin: 2cm; }
+body { font-family: serif; font-size: 11pt; }
+h1 { break-before: page; }
+</style>
+</head>
+<body>
+<h1 class="title">{{title}}</h1>
+{{toc}}
+{{body}}
+</body>
+</html>
+"""
+
+NOTE_TEMPLATE = """<html>
+<head>
+<style>
+@page { size: A4; margin: 2cm; }
+body { font-family: sans-serif; }
+</style>
+</head>
+<body>
+<h1>{{title}}</h1>
+{{body}}
+</body>
+</html>
+"""
+
+
+class Corpus:
+    """Generated input of one benchmark.
+
+    Attributes:
+        template_dir (Path): template directory to set in the config
+        template (str): template to publish with
+        md_paths (List[Path]): markdown files to publish
+    """
+
+    def __init__(self, template_dir: Path, template: str, md_paths: List[Path]):
+        self.template_dir = template_dir
+        self.template = template
+        self.md_paths = md_paths
+
+
+def _sentence(random: Random, length: int) -> str:
+    words = [random.choice(WORDS) for _ in range(length)]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(random: Random, sentences: int) -> str:
+    return " ".join(_sentence(random, random.randint(6, 14)) for _ in range(sentences))
+
+
+def _write_template(directory: Path, name: str, template_html: str) -> Path:
+    template_dir = directory / "templates"
+    (template_dir / name).mkdir(parents=True, exist_ok=True)
+    (template_dir / name / "template.html").write_text(template_html)
+    return template_dir
+
+
+def _frontmatter(metadata: Dict[str, str]) -> str:
+    lines = [f'{key}: "{value}"' for key, value in metadata.items()]
+    return "---\n" + "\n".join(lines) + "\n---\n"
+
+
+def invoice(directory: Path) -> Corpus:
+    """A one page invoice with many frontmatter keys and a short table."""
+    random = Random(1)
+    template_dir = _write_template(directory, "invoice", INVOICE_TEMPLATE)
+    metadata = {
+        "company": "ACME & Sons",
+        "address": "Main street 1",
+        "city": "Ghent",
+        "number": "2024-0042",
+        "date": "2024-01-31",
+        "due": "2024-02-29",
+        "client": "Example Corp",
+        "client_address": "Second street 2",
+        "reference": "REF-123",
+        "project": "Website *redesign*",
+        "po_number": "PO-9",
+        "vat": "BE0123456789",
+        "iban": "BE68 5390 0754 7034",
+        "bic": "GKCCBEBB",
+        "notes": "Payable within **30 days**.",
+    }
+    rows = "\n".join(
+        f"| {_sentence(random, 4)} | {random.randint(1, 9)} | {random.randint(10, 500)}.00 |"
+        for _ in range(12)
+    )
+    md_path = directory / "invoice.md"
+    md_path.write_text(
+        _frontmatter(metadata)
+        + "\n| Item | Amount | Price |\n|---|---|---|\n"
+        + rows
+        + "\n\n"
+        + _paragraph(random, 3)
+        + "\n"
+    )
+    return Corpus(template_dir, "invoice", [md_path])
+
+
+def manual(directory: Path) -> Corpus:
+    """A manual of about 500 pages with four levels of headings."""
+    random = Random(2)
+    template_dir = _write_template(directory, "manual", MANUAL_TEMPLATE)
+    sections = []
+    for chapter in range(1, 61):
+        sections.append(f"# Chapter {chapter}\n\n{_paragraph(random, 6)}\n")
+        for section in range(1, 5):
+            sections.append(
+                f"## Section {chapter}.{section}\n\n{_paragraph(random, 8)}\n"
+            )
+            for subsection in range(1, 4):
+                sections.append(
+                    f"### Topic {chapter}.{section}.{subsection}\n\n"
+                    f"{_paragraph(random, 10)}\n\n"
+                    f"#### Details {chapter}.{section}.{subsection}\n\n"
+                    f"{_paragraph(random, 10)}\n"
+                )
+    md_path = directory / "manual.md"
+    md_path.write_text(
+        _frontmatter({"title": "Synthetic manual"}) + "\n".join(sections)
+    )
+    return Corpus(template_dir, "manual", [md_path])
+
+
+def images(directory: Path) -> Corpus:
+    """A note embedding 200 photo sized images."""
+    from PIL import Image
+
+    random = Random(3)
+    template_dir = _write_template(directory, "note", NOTE_TEMPLATE)
+    attachments = directory / ATTACHMENTS_FOLDER
+    attachments.mkdir(parents=True, exist_ok=True)
+    embeds = []
+    for index in range(200):
+        # Blurry noise scaled up from a small tile compresses like a photo.
+        tile = Image.frombytes("RGB", (100, 75), random.randbytes(100 * 75 * 3))
+        image = tile.resize((1600, 1200), Image.Resampling.BICUBIC)
+        image_name = f"photo-{index}.jpg"
+        image.save(attachments / image_name, "JPEG", quality=90)
+        embeds.append(f"![[{image_name}]]\n\n{_sentence(random, 10)}\n")
+    md_path = directory / "images.md"
+    md_path.write_text(_frontmatter({"title": "Photos"}) + "\n".join(embeds))
+    return Corpus(template_dir, "note", [md_path])
+
+
+def table(directory: Path) -> Corpus:
+    """A note holding a markdown table of 10,000 rows."""
+    random = Random(4)
+    template_dir = _write_template(directory, "note", NOTE_TEMPLATE)
+    rows = "\n".join(
+        f"| {row} | {random.choice(WORDS)} | {random.choice(WORDS)} | "
+        f"{random.randint(0, 10000)} |"
+        for row in range(10000)
+    )
+    md_path = directory / "table.md"
+    md_path.write_text(
+        _frontmatter({"title": "Large table"})
+        + "| Row | Name | Kind | Value |\n|---|---|---|---|\n"
+        + rows
+        + "\n"
+    )
+    return Corpus(template_dir, "note", [md_path])
+
+
+def vault(directory: Path) -> Corpus:
+    """A vault of 1,000 short notes in nested folders."""
+    random = Random(5)
+    template_dir = _write_template(directory, "note", NOTE_TEMPLATE)
+    md_paths = []
+    for index in range(1000):
+        folder = directory / "vault" / f"area-{index % 10}" / f"topic-{index % 7}"
+        folder.mkdir(parents=True, exist_ok=True)
+        md_path = folder / f"note-{index}.md"
+        md_path.write_text(
+            _frontmatter({"title": f"Note {index}"})
+            + f"## {_sentence(random, 4)}\n\n{_paragraph(random, 5)}\n\n"
+            + f"- {_sentence(random, 5)}\n- {_sentence(random, 5)}\n"
+        )
+        md_paths.append(md_path)
+    return Corpus(template_dir, "note", md_paths)
+
+
+CORPORA: Dict[str, Callable[[Path], Corpus]] = {
+    "invoice": invoice,
+    "manual": manual,
+    "images": images,
+    "table": table,
+    "vault": vault,
+}
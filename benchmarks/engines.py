@@ -0,0 +1,68 @@
+"""Compare the throughput of the markdown engines.
+
+    python -m benchmarks.engines
+    python -m benchmarks.engines -c manual --repeat 5
+
+Only the markdown to html conversion of the corpora is timed, without the
+frontmatter, the template or the layout. Engines that are not installed are
+skipped.
+"""
+
+from pathlib import Path
+from time import perf_counter
+import tempfile
+
+import click
+import frontmatter
+
+from benchmarks.corpora import CORPORA
+from mdexport.engines import MARKDOWN_ENGINES
+
+# Corpora with enough markdown to measure, the others are mostly frontmatter
+# or images.
+ENGINE_CORPORA = ["manual", "table", "vault"]
+
+
+def measure_engine(engine_name: str, md_texts: list, repeat: int) -> float:
+    """Fastest time of an engine converting all texts, in seconds."""
+    engine = MARKDOWN_ENGINES[engine_name]()
+    runs = []
+    for _ in range(repeat):
+        start = perf_counter()
+        for md_text in md_texts:
+            engine.convert(md_text)
+        runs.append(perf_counter() - start)
+    return min(runs)
+
+
+@click.command()
+@click.option(
+    "--corpus",
+    "-c",
+    "corpora",
+    multiple=True,
+    type=click.Choice(ENGINE_CORPORA),
+    help="Corpus to convert, can be repeated. Converts all by default.",
+)
+@click.option("--repeat", default=3, help="Conversions per engine and corpus.")
+def cli(corpora: tuple, repeat: int):
+    """Compare the throughput of the markdown engines."""
+    with tempfile.TemporaryDirectory(prefix="mdexport-bench-engines-") as directory:
+        for corpus_name in corpora or ENGINE_CORPORA:
+            corpus = CORPORA[corpus_name](Path(directory) / corpus_name)
+            md_texts = [frontmatter.load(path).content for path in corpus.md_paths]
+            megabytes = sum(len(md_text.encode()) for md_text in md_texts) / 1e6
+            click.echo(f"{corpus_name}: {megabytes:.1f} MB of markdown")
+            for engine_name in MARKDOWN_ENGINES:
+                try:
+                    seconds = measure_engine(engine_name, md_texts, repeat)
+                except ImportError:
+                    click.echo(f"    {engine_name:<12} not installed")
+                    continue
+                click.echo(
+                    f"    {engine_name:<12} {seconds:8.3f}s  {megabytes / seconds:6.2f} MB/s"
+                )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,230 @@
+"""Run the benchmarks and compare them to a stored baseline.
+
+    python -m benchmarks.run                  # run all, compare to the baseline
+    python -m benchmarks.run --save-baseline  # run all, store them as baseline
+    python -m benchmarks.run -b manual -b vault
+
+Every benchmark runs in a fresh Python process with its own home and cache
+directory, so it does not read or change your mdexport config and its peak
+memory is not mixed up with the other benchmarks. Nothing is fetched from the
+network.
+"""
+
+from pathlib import Path
+from time import perf_counter
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+
+import click
+
+from benchmarks.corpora import CORPORA
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+TOC_DEPTH = 3
+# Metrics compared to the baseline, lower is better for all of them.
+COMPARED_METRICS = ["seconds", "peak_memory_mb"]
+
+
+def run_benchmark(name: str, directory: Path, repeat: int) -> dict:
+    """Generate a corpus and publish it, in the current process.
+
+    Args:
+        name (str): name of the corpus
+        directory (Path): empty directory for the corpus and the pdf files
+        repeat (int): number of publishes, the fastest one is reported
+
+    Returns:
+        dict: the fastest and the first (cold) wall time, the stage timings of
+        the fastest publish and the peak memory of the process
+    """
+    from mdexport.batch import publish_batch
+    from mdexport.config import ConfigStructure, get_config
+    from mdexport.core import publish_md_file
+    from mdexport.timings import get_timings, reset_timings
+
+    corpus = CORPORA[name](directory / "corpus")
+    get_config().override(ConfigStructure.TEMPLATE_DIR, str(corpus.template_dir))
+    output_dir = directory / "output"
+    output_dir.mkdir()
+
+    runs = []
+    for _ in range(repeat):
+        reset_timings()
+        start = perf_counter()
+        if len(corpus.md_paths) == 1:
+            publish_md_file(
+                corpus.md_paths[0],
+                output_dir / "output.pdf",
+                corpus.template,
+                TOC_DEPTH,
+            )
+        else:
+            jobs = [
+                (md_path, output_dir / f"{index}.pdf")
+                for index, md_path in enumerate(corpus.md_paths)
+            ]
+            for result in publish_batch(
+                jobs, corpus.template, TOC_DEPTH, os.cpu_count() or 1
+            ):
+                if not result.succeeded:
+                    raise click.ClickException(f"{result.md_path}: {result.error}")
+        runs.append((perf_counter() - start, get_timings()))
+
+    seconds, stages = min(runs, key=lambda run: run[0])
+    # ru_maxrss is in kilobytes on Linux. Batch workers are child processes.
+    peak_memory = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return {
+        "seconds": seconds,
+        "cold_seconds": runs[0][0],
+        "peak_memory_mb": peak_memory / 1024,
+        "stages": stages,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """List the metrics that got worse than the baseline allows.
+
+    Args:
+        results (dict): benchmark name to its metrics
+        baseline (dict): benchmark name to its baseline metrics
+        tolerance (float): allowed relative increase, 0.25 allows 25% more
+
+    Returns:
+        list: (benchmark, metric, baseline value, value) of every regression
+    """
+    regressions = []
+    for name, metrics in results.items():
+        for metric in COMPARED_METRICS:
+            if name not in baseline or metric not in baseline[name]:
+                continue
+            if metrics[metric] > baseline[name][metric] * (1 + tolerance):
+                regressions.append(
+                    (name, metric, baseline[name][metric], metrics[metric])
+                )
+    return regressions
+
+
+def _run_in_subprocess(name: str, repeat: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix=f"mdexport-bench-{name}-") as directory:
+        directory = Path(directory)
+        env = dict(os.environ)
+        env["HOME"] = str(directory / "home")
+        env["XDG_CACHE_HOME"] = str(directory / "cache")
+        env.pop("XDG_RUNTIME_DIR", None)
+        (directory / "home").mkdir()
+        result_path = directory / "result.json"
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.run",
+                "case",
+                name,
+                str(directory),
+                str(repeat),
+                str(result_path),
+            ],
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        return json.loads(result_path.read_text())
+
+
+def _format_result(name: str, metrics: dict) -> str:
+    lines = [
+        f"{name}: {metrics['seconds']:.3f}s (cold {metrics['cold_seconds']:.3f}s), "
+        f"peak memory {metrics['peak_memory_mb']:.0f} MB"
+    ]
+    for stage, timing in metrics["stages"].items():
+        lines.append(
+            f"    {stage:<18} {timing['seconds']:8.3f}s  {timing['calls']:>4}x"
+        )
+    return "\n".join(lines)
+
+
+@click.group(invoke_without_command=True)
+@click.option(
+    "--benchmark",
+    "-b",
+    "benchmarks",
+    multiple=True,
+    type=click.Choice(list(CORPORA)),
+    help="Benchmark to run, can be repeated. Runs all by default.",
+)
+@click.option("--repeat", default=3, help="Publishes per benchmark.")
+@click.option(
+    "--baseline",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=BASELINE_PATH,
+    help="Baseline to compare to or to save.",
+)
+@click.option(
+    "--save-baseline", is_flag=True, help="Store the results as the new baseline."
+)
+@click.option(
+    "--tolerance",
+    default=0.25,
+    help="Allowed increase over the baseline, 0.25 allows 25% slower or larger.",
+)
+@click.pass_context
+def cli(
+    ctx: click.Context,
+    benchmarks: tuple,
+    repeat: int,
+    baseline: Path,
+    save_baseline: bool,
+    tolerance: float,
+):
+    """Run the mdexport benchmarks."""
+    if ctx.invoked_subcommand is not None:
+        return
+    results = {}
+    for name in benchmarks or CORPORA:
+        results[name] = _run_in_subprocess(name, repeat)
+        click.echo(_format_result(name, results[name]))
+
+    if save_baseline:
+        stored = json.loads(baseline.read_text()) if baseline.is_file() else {}
+        stored.update(results)
+        stored["_machine"] = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        }
+        baseline.write_text(json.dumps(stored, indent=2) + "\n")
+        click.echo(f"Saved the baseline to {baseline}.")
+        return
+    if not baseline.is_file():
+        click.echo(f"No baseline at {baseline}, store one with --save-baseline.")
+        return
+    regressions = compare(results, json.loads(baseline.read_text()), tolerance)
+    for name, metric, baseline_value, value in regressions:
+        click.echo(
+            f"REGRESSION {name} {metric}: {value:.3f}, baseline {baseline_value:.3f}"
+        )
+    if regressions:
+        sys.exit(1)
+    click.echo(f"No regressions beyond {tolerance:.0%} of the baseline.")
+
+
+@cli.command(hidden=True)
+@click.argument("name")
+@click.argument("directory", type=click.Path(path_type=Path))
+@click.argument("repeat", type=int)
+@click.argument("result_path", type=click.Path(path_type=Path))
+def case(name: str, directory: Path, repeat: int, result_path: Path):
+    """Run one benchmark in this process and write its result as json."""
+    result_path.write_text(json.dumps(run_benchmark(name, directory, repeat)))
+
+
+if __name__ == "__main__":
+    cli()
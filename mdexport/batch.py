@@ -0,0 +1,184 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from glob import glob
+from pathlib import Path
+from time import perf_counter
+from typing import Iterator, List, Tuple
+import re
+
+from mdexport.config import get_config, use_config
+from mdexport.core import publish_md_file
+from mdexport.exporter import get_base_stylesheet
+from mdexport.templates import load_template
+
+GLOB_WILDCARD_PATTERN = re.compile(r"[*?[]")
+
+
+class DuplicateOutputException(Exception):
+    pass
+
+
+class BatchResult:
+    """Outcome of publishing one markdown file in a batch."""
+
+    def __init__(
+        self,
+        md_path: Path,
+        output: Path,
+        seconds: float,
+        error: str | None = None,
+        cached: bool = False,
+        size: int = 0,
+    ):
+        self.md_path = md_path
+        self.output = output
+        self.seconds = seconds
+        self.error = error
+        self.cached = cached
+        self.size = size
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+def collect_md_files(inputs: List[str], output_dir: Path) -> List[Tuple[Path, Path]]:
+    """Expand files, directories and glob patterns to (markdown file, pdf file) pairs.
+
+    Markdown files found in a directory keep their path relative to that
+    directory inside the output directory, and glob matches their path relative
+    to the folders in front of the first wildcard. Files are written straight
+    into the output directory.
+
+    Args:
+        inputs (List[str]): markdown files, directories or glob patterns
+        output_dir (Path): directory the pdf files are written to
+
+    Raises:
+        DuplicateOutputException: two markdown files would be written to the
+            same pdf file
+
+    Returns:
+        List[Tuple[Path, Path]]: markdown file and its pdf output path
+    """
+    jobs = {}
+    for md_input in inputs:
+        input_path = Path(md_input)
+        if input_path.is_dir():
+            for md_path in sorted(input_path.rglob("*.md")):
+                relative_path = md_path.relative_to(input_path)
+                jobs[md_path.resolve()] = output_dir / relative_path.with_suffix(".pdf")
+            continue
+        if input_path.is_file():
+            if input_path.suffix == ".md":
+                jobs[input_path.resolve()] = output_dir / input_path.with_suffix(
+                    ".pdf"
+                ).name
+            continue
+        glob_root = get_glob_root(md_input)
+        for md_path in sorted(Path(match) for match in glob(md_input, recursive=True)):
+            if md_path.suffix == ".md" and md_path.is_file():
+                relative_path = md_path.relative_to(glob_root)
+                jobs[md_path.resolve()] = output_dir / relative_path.with_suffix(".pdf")
+
+    md_paths_by_output = {}
+    for md_path, output in jobs.items():
+        md_paths_by_output.setdefault(output, []).append(md_path)
+    duplicates = [
+        f"{output} from {', '.join(str(md_path) for md_path in md_paths)}"
+        for output, md_paths in md_paths_by_output.items()
+        if len(md_paths) > 1
+    ]
+    if duplicates:
+        raise DuplicateOutputException(
+            "Several markdown files would be published to the same pdf file:\n"
+            + "\n".join(duplicates)
+        )
+    return list(jobs.items())
+
+
+def get_glob_root(pattern: str) -> Path:
+    """The folders at the start of a glob pattern, up to the first wildcard."""
+    root = []
+    for part in Path(pattern).parts[:-1]:
+        if GLOB_WILDCARD_PATTERN.search(part):
+            break
+        root.append(part)
+    return Path(*root)
+
+
+def _init_worker(template: str | None, stored: dict, overrides: dict) -> None:
+    """Load the fonts, the base style and the template once per worker process."""
+    use_config(stored, overrides)
+    get_base_stylesheet()
+    if template:
+        load_template(template)
+
+
+def _publish_job(
+    md_path: Path,
+    output: Path,
+    template: str | None,
+    toc_depth: int,
+    use_cache: bool,
+    refresh: bool,
+) -> BatchResult:
+    start = perf_counter()
+    try:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        cached = publish_md_file(
+            md_path, output, template, toc_depth, use_cache, refresh
+        )
+    except Exception as e:
+        return BatchResult(md_path, output, perf_counter() - start, f"{e}")
+    return BatchResult(
+        md_path,
+        output,
+        perf_counter() - start,
+        cached=cached,
+        size=output.stat().st_size,
+    )
+
+
+def publish_batch(
+    jobs: List[Tuple[Path, Path]],
+    template: str | None,
+    toc_depth: int,
+    workers: int,
+    use_cache: bool = False,
+    refresh: bool = False,
+) -> Iterator[BatchResult]:
+    """Publish many markdown files over a pool of worker processes.
+
+    A failing file does not stop the batch, its error is reported in its result.
+    When a worker process dies, like killed for running out of memory, the files
+    it was publishing and those not published yet fail.
+
+    Args:
+        jobs (List[Tuple[Path, Path]]): markdown file and its pdf output path
+        template (str | None): template name
+        toc_depth (int): deepest heading level in the table of content
+        workers (int): number of worker processes
+        use_cache (bool): reuse and store pdf files in the output cache
+        refresh (bool): render even when the cache has the pdf, and replace it
+
+    Yields:
+        BatchResult: result of each file, in order of completion
+    """
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(template, get_config().stored, get_config().overrides),
+    ) as executor:
+        futures = {
+            executor.submit(
+                _publish_job, md_path, output, template, toc_depth, use_cache, refresh
+            ): (md_path, output)
+            for md_path, output in jobs
+        }
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except BrokenProcessPool as e:
+                md_path, output = futures[future]
+                yield BatchResult(md_path, output, 0.0, f"worker process died: {e}")
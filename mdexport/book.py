@@ -0,0 +1,197 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+import re
+
+import weasyprint
+
+from mdexport.config import get_config, use_config
+from mdexport.core import generate_renderable_html, warn_missing_metadata
+from mdexport.exporter import write_document_to_pdf, write_render_html
+from mdexport.markdown import (
+    MarkdownDocument,
+    generate_toc_from_headers,
+    get_heading_pages,
+    parse_md_file,
+)
+
+# Matches the id of a heading, and the href of a link to an id in the page.
+HEADING_ID_PATTERN = r'(<h[1-6]\b[^>]*?\bid=")([^"]+)(")'
+LOCAL_LINK_PATTERN = r'(<a\b[^>]*?\bhref="#)([^"]+)(")'
+
+# The pages of the table of content are not numbered. Numbering starts at the
+# first chapter, like it starts at the first heading of a single note.
+BOOK_TOC_HTML = """<html>
+<head>
+</head>
+<body>
+<style>
+@page {{
+    counter-reset: page 0;
+    @bottom-right {{
+        content: none;
+    }}
+}}
+</style>
+{toc}
+</body>
+</html>
+"""
+
+
+def collect_chapters(inputs: List[str]) -> List[Path]:
+    """Expand the book inputs to markdown files, keeping their order.
+
+    Args:
+        inputs (List[str]): markdown files and directories, a directory adds its
+            markdown files sorted by path
+
+    Returns:
+        List[Path]: markdown file of every chapter, in order
+    """
+    chapters = []
+    for book_input in inputs:
+        input_path = Path(book_input)
+        if input_path.is_dir():
+            chapters.extend(sorted(input_path.rglob("*.md")))
+        else:
+            chapters.append(input_path)
+    return chapters
+
+
+def prefix_heading_ids(md_document: MarkdownDocument, prefix: str) -> MarkdownDocument:
+    """Make the heading ids of a chapter unique within the book.
+
+    Notes often share headings like "Introduction" and markdown2 gives those the
+    same id in every note. The ids and the links to them in the chapter get the
+    prefix.
+
+    Args:
+        md_document (MarkdownDocument): parsed chapter
+        prefix (str): prefix of the ids of this chapter
+
+    Returns:
+        MarkdownDocument: chapter with prefixed heading ids
+    """
+    heading_ids = {heading_id for _, heading_id, _ in md_document.headers}
+
+    def replace_id(match):
+        if match.group(2) not in heading_ids:
+            return match.group(0)
+        return f"{match.group(1)}{prefix}{match.group(2)}{match.group(3)}"
+
+    html_text = re.sub(HEADING_ID_PATTERN, replace_id, md_document.html)
+    html_text = re.sub(LOCAL_LINK_PATTERN, replace_id, html_text)
+    return MarkdownDocument(
+        md_document.md_path,
+        md_document.metadata,
+        md_document.content,
+        html_text,
+        [
+            (level, f"{prefix}{heading_id}", text)
+            for level, heading_id, text in md_document.headers
+        ],
+        md_document.toc_html,
+    )
+
+
+def generate_first_page_css(first_page: int) -> str:
+    """Style numbering the pages of a chapter from its page in the book."""
+    return f"<style>@page:first {{ counter-reset: page {first_page}; }}</style>"
+
+
+def render_chapter(
+    md_document: MarkdownDocument, template: str | None, first_page: int
+) -> weasyprint.Document:
+    """Lay out one chapter with the page numbers it gets in the book.
+
+    Args:
+        md_document (MarkdownDocument): parsed chapter
+        template (str | None): template name
+        first_page (int): page number of the first page of the chapter
+
+    Returns:
+        weasyprint.Document: laid out chapter
+    """
+    warn_missing_metadata(md_document, template)
+    chapter = MarkdownDocument(
+        md_document.md_path,
+        md_document.metadata,
+        md_document.content,
+        generate_first_page_css(first_page) + md_document.html,
+        md_document.headers,
+        md_document.toc_html,
+    )
+    return write_render_html(template, generate_renderable_html(chapter, template))
+
+
+def parse_chapters(md_paths: List[Path], workers: int) -> List[MarkdownDocument]:
+    """Parse the chapters over a pool of worker processes.
+
+    Args:
+        md_paths (List[Path]): markdown file of every chapter, in order
+        workers (int): number of worker processes
+
+    Returns:
+        List[MarkdownDocument]: parsed chapters, in order
+    """
+    if workers == 1 or len(md_paths) == 1:
+        return [parse_md_file(md_path) for md_path in md_paths]
+    config = get_config()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=use_config,
+        initargs=(config.stored, config.overrides),
+    ) as executor:
+        return list(executor.map(parse_md_file, md_paths))
+
+
+def publish_book(
+    md_paths: List[Path],
+    output: Path,
+    template: str | None,
+    toc_depth: int,
+    workers: int,
+) -> int:
+    """Publish markdown files as the chapters of a single pdf file.
+
+    The chapters are parsed in parallel and laid out one by one, each numbered
+    from the page it starts on in the book. A table of content of all chapters
+    goes in front and the pages of all documents are written as one pdf.
+
+    Args:
+        md_paths (List[Path]): markdown file of every chapter, in order
+        output (Path): path of the pdf file
+        template (str | None): template every chapter is filled into
+        toc_depth (int): deepest heading level in the table of content
+        workers (int): number of worker processes parsing the chapters
+
+    Returns:
+        int: number of pages in the book
+    """
+    md_documents = [
+        prefix_heading_ids(md_document, f"chapter-{index}-")
+        for index, md_document in enumerate(
+            parse_chapters(md_paths, workers), start=1
+        )
+    ]
+    chapters = []
+    heading_pages = {}
+    first_page = 1
+    for md_document in md_documents:
+        chapter = render_chapter(md_document, template, first_page)
+        heading_ids = [heading_id for _, heading_id, _ in md_document.headers]
+        for heading_id, page in get_heading_pages(chapter, heading_ids).items():
+            heading_pages[heading_id] = first_page + page - 1
+        chapters.append(chapter)
+        first_page += len(chapter.pages)
+
+    headers = [header for md_document in md_documents for header in md_document.headers]
+    toc_html = generate_toc_from_headers(headers, toc_depth, heading_pages)
+    documents = chapters
+    if toc_html:
+        documents = [write_render_html(None, BOOK_TOC_HTML.format(toc=toc_html))] + chapters
+    pages = [page for document in documents for page in document.pages]
+    write_document_to_pdf(chapters[0].copy(pages), output, template)
+    return len(pages)
+
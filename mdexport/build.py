@@ -0,0 +1,208 @@
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+import json
+
+from mdexport.batch import BatchResult, collect_md_files, publish_batch
+from mdexport.cache import compute_publish_digest, write_atomic
+from mdexport.config import get_relevant_config, get_templates_directory
+from mdexport.markdown import get_referenced_files
+from mdexport.templates import get_template_files
+
+BUILD_MANIFEST_FILENAME = ".mdexport-build.json"
+# Bump when the manifest format changes, older manifests rebuild everything.
+BUILD_MANIFEST_VERSION = 2
+
+
+def get_dependencies(md_path: Path, template: str | None) -> List[Path]:
+    """Files a pdf is rendered from: the note, the files it embeds and the files
+    of its template. Embedded files that do not exist yet are included, so the
+    pdf is published again once they are added.
+
+    Args:
+        md_path (Path): path to the markdown file
+        template (str | None): template name
+
+    Returns:
+        List[Path]: dependencies, the note first
+    """
+    md_content = md_path.read_text(errors="replace")
+    dependencies = [md_path] + get_referenced_files(md_content, md_path)
+    if template:
+        # The folder itself changes when files are added or removed.
+        dependencies.append(get_templates_directory() / template)
+        dependencies.extend(get_template_files(template))
+    return dependencies
+
+
+def stat_dependencies(dependencies: List[Path]) -> Dict[str, list | None]:
+    """Modification time and size of every dependency, None for missing ones,
+    by path."""
+    return {str(dependency): _stat_dependency(dependency) for dependency in dependencies}
+
+
+def _stat_dependency(path: Path) -> list | None:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _dependencies_unchanged(stats: Dict[str, list | None]) -> bool:
+    return all(
+        _stat_dependency(Path(path)) == recorded for path, recorded in stats.items()
+    )
+
+
+class BuildPlan:
+    """What a build has to do to bring an output directory up to date.
+
+    Attributes:
+        dirty (List[Tuple[Path, Path]]): markdown file and pdf output to publish
+        unchanged (List[Path]): outputs that are up to date
+        orphans (List[Path]): outputs of notes that no longer exist
+        manifest (dict): manifest with the unchanged outputs and their
+            dependencies, the dirty outputs are added once they are published
+    """
+
+    def __init__(self):
+        self.dirty: List[Tuple[Path, Path]] = []
+        self.unchanged: List[Path] = []
+        self.orphans: List[Path] = []
+        self.manifest: dict = {}
+
+
+def load_build_manifest(output_dir: Path) -> dict:
+    try:
+        manifest = json.loads((output_dir / BUILD_MANIFEST_FILENAME).read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if manifest.get("version") != BUILD_MANIFEST_VERSION:
+        return {}
+    return manifest
+
+
+def save_build_manifest(output_dir: Path, manifest: dict) -> None:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    write_atomic(
+        output_dir / BUILD_MANIFEST_FILENAME, json.dumps(manifest, indent=1).encode()
+    )
+
+
+def plan_build(
+    vault_dir: Path,
+    output_dir: Path,
+    template: str | None,
+    toc_depth: int,
+    force: bool = False,
+) -> BuildPlan:
+    """Compare the notes of a vault with the manifest of the last build.
+
+    An output is unchanged when its pdf exists, the options are the same and
+    none of its dependencies changed size or modification time. When only the
+    modification time changed, the digest of the content decides.
+
+    Args:
+        vault_dir (Path): directory holding the notes
+        output_dir (Path): directory the pdf files are written to
+        template (str | None): template name
+        toc_depth (int): deepest heading level in the table of content
+        force (bool): publish every note
+
+    Returns:
+        BuildPlan: outputs to publish, to keep and to delete
+    """
+    options = {
+        "template": template,
+        "toc_depth": toc_depth,
+        "config": get_relevant_config(),
+    }
+    previous = load_build_manifest(output_dir)
+    previous_outputs = previous.get("outputs", {})
+    if force or previous.get("options") != options:
+        previous_outputs = {}
+
+    plan = BuildPlan()
+    plan.manifest = {
+        "version": BUILD_MANIFEST_VERSION,
+        "options": options,
+        "outputs": {},
+    }
+    jobs = collect_md_files([str(vault_dir)], output_dir)
+    outputs = {str(output.relative_to(output_dir)) for _, output in jobs}
+    for md_path, output in jobs:
+        key = str(output.relative_to(output_dir))
+        entry = previous_outputs.get(key)
+        if entry and output.is_file() and entry["note"] == str(md_path):
+            if _dependencies_unchanged(entry["dependencies"]):
+                plan.unchanged.append(output)
+                plan.manifest["outputs"][key] = entry
+                continue
+            # Touched but maybe not changed, like after a checkout or a sync.
+            if compute_publish_digest(md_path, template, toc_depth) == entry["digest"]:
+                entry["dependencies"] = stat_dependencies(
+                    get_dependencies(md_path, template)
+                )
+                plan.unchanged.append(output)
+                plan.manifest["outputs"][key] = entry
+                continue
+        plan.dirty.append((md_path, output))
+    plan.orphans = [
+        output_dir / key for key in previous.get("outputs", {}) if key not in outputs
+    ]
+    return plan
+
+
+def run_build(
+    plan: BuildPlan,
+    output_dir: Path,
+    template: str | None,
+    toc_depth: int,
+    workers: int,
+) -> Iterator[BatchResult]:
+    """Delete the orphans and publish the dirty outputs of a plan in parallel.
+
+    The manifest is saved after the build, published outputs are recorded with
+    the dependencies they had before they were published, so a note edited
+    during the build is published again by the next one.
+
+    Args:
+        plan (BuildPlan): plan made by plan_build
+        output_dir (Path): directory the pdf files are written to
+        template (str | None): template name
+        toc_depth (int): deepest heading level in the table of content
+        workers (int): number of worker processes
+
+    Yields:
+        BatchResult: result of each published note, in order of completion
+    """
+    for orphan in plan.orphans:
+        orphan.unlink(missing_ok=True)
+        _remove_empty_parents(orphan, output_dir)
+    pending = {}
+    for md_path, output in plan.dirty:
+        dependencies = get_dependencies(md_path, template)
+        pending[output] = {
+            "note": str(md_path),
+            "digest": compute_publish_digest(md_path, template, toc_depth),
+            "dependencies": stat_dependencies(dependencies),
+        }
+    try:
+        if plan.dirty:
+            for result in publish_batch(plan.dirty, template, toc_depth, workers):
+                if result.succeeded:
+                    key = str(result.output.relative_to(output_dir))
+                    plan.manifest["outputs"][key] = pending[result.output]
+                yield result
+    finally:
+        save_build_manifest(output_dir, plan.manifest)
+
+
+def _remove_empty_parents(path: Path, root: Path) -> None:
+    parent = path.parent
+    while parent != root and root in parent.parents:
+        try:
+            parent.rmdir()
+        except OSError:
+            return
+        parent = parent.parent
@@ -0,0 +1,258 @@
+from contextlib import contextmanager
+from pathlib import Path
+from time import time
+from typing import Iterator
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, where the cache is not shared by parallel processes safely.
+    fcntl = None
+
+from mdexport.config import (
+    get_cache_directory,
+    get_cache_size,
+    get_relevant_config,
+    get_templates_directory,
+)
+from mdexport.markdown import get_referenced_files
+from mdexport.templates import get_template_files
+
+OUTPUT_CACHE_DIRNAME = "pdf"
+MANIFEST_FILENAME = "manifest.json"
+LOCK_FILENAME = "manifest.lock"
+# Bump when a change to mdexport changes the pdf it renders for the same input.
+CACHE_VERSION = "1"
+TOC_OFFSETS_FILENAME = "toc_offsets.json"
+# Notes whose table of content offset is remembered, the least recently
+# settled ones are forgotten first.
+MAX_TOC_OFFSETS = 1000
+
+
+def compute_publish_digest(md_path: Path, template: str | None, toc_depth: int) -> str:
+    """Digest of everything a publish renders from.
+
+    It covers the markdown file, the files it embeds, the files the template is
+    rendered from, the table of content depth and the relevant options.
+
+    Args:
+        md_path (Path): path to the markdown file
+        template (str | None): template name
+        toc_depth (int): deepest heading level in the table of content
+
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.sha256()
+
+    def add(label: str, data: bytes):
+        digest.update(f"{label}:{len(data)}:".encode())
+        digest.update(data)
+
+    add("version", CACHE_VERSION.encode())
+    add("config", json.dumps(get_relevant_config(), sort_keys=True).encode())
+    add("toc", str(toc_depth).encode())
+    md_bytes = md_path.read_bytes()
+    add("markdown", md_bytes)
+    md_content = md_bytes.decode("utf-8", errors="replace")
+    for reference in get_referenced_files(md_content, md_path):
+        if not reference.is_file():
+            continue
+        add(f"attachment {reference.resolve()}", reference.read_bytes())
+    if template:
+        templates_directory = get_templates_directory()
+        for template_file in get_template_files(template):
+            relative_path = template_file.relative_to(templates_directory)
+            add(f"template {relative_path.as_posix()}", template_file.read_bytes())
+    return digest.hexdigest()
+
+
+class OutputCache:
+    """Published pdf files stored by the digest of their input.
+
+    The manifest keeps the size and last use of every entry, the least recently
+    used entries are removed once the cache grows beyond its maximum size.
+    Processes publishing in parallel take turns changing the manifest, so none
+    of them loses the entries of another.
+    """
+
+    def __init__(self, directory: Path, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+        self.manifest_path = directory / MANIFEST_FILENAME
+
+    def _entry_path(self, digest: str) -> Path:
+        return self.directory / f"{digest}.pdf"
+
+    def _load_manifest(self) -> dict:
+        try:
+            return json.loads(self.manifest_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_manifest(self, manifest: dict) -> None:
+        write_atomic(self.manifest_path, json.dumps(manifest).encode())
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the lock of the cache while loading, changing and saving the
+        manifest."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / LOCK_FILENAME, "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def restore(self, digest: str, output: Path) -> bool:
+        """Put the cached pdf for a digest at the output path.
+
+        Args:
+            digest (str): publish digest
+            output (Path): path of the pdf file
+
+        Returns:
+            bool: whether the digest was in the cache
+        """
+        entry_path = self._entry_path(digest)
+        with self._locked():
+            manifest = self._load_manifest()
+            if digest not in manifest or not entry_path.is_file():
+                return False
+            copy_atomic(entry_path, output)
+            manifest[digest]["last_used"] = time()
+            self._save_manifest(manifest)
+        return True
+
+    def store(self, digest: str, output: Path) -> None:
+        """Add a freshly published pdf to the cache.
+
+        Args:
+            digest (str): publish digest
+            output (Path): path of the published pdf file
+        """
+        size = output.stat().st_size
+        if size > self.max_size:
+            return
+        with self._locked():
+            write_atomic(self._entry_path(digest), output.read_bytes())
+            manifest = self._load_manifest()
+            manifest[digest] = {"size": size, "last_used": time()}
+            self._evict(manifest)
+            self._save_manifest(manifest)
+
+    def load_toc_offset(self, md_path: Path, template: str, toc_depth: int) -> int:
+        """Number of pages in front of the first heading the last time a note
+        was laid out in a template, 0 when it was not laid out before.
+
+        Args:
+            md_path (Path): path to the markdown file
+            template (str): template name
+            toc_depth (int): deepest heading level in the table of content
+
+        Returns:
+            int: offset to lay the note out with first
+        """
+        offsets = self._load_toc_offsets()
+        return offsets.get(_toc_offset_key(md_path, template, toc_depth), 0)
+
+    def save_toc_offset(
+        self, md_path: Path, template: str, toc_depth: int, offset: int
+    ) -> None:
+        """Remember the offset a note settled at, for the next time it is laid
+        out. A cache that can not be written is skipped, the note is laid out
+        from the wrong offset once more next time.
+
+        Args:
+            md_path (Path): path to the markdown file
+            template (str): template name
+            toc_depth (int): deepest heading level in the table of content
+            offset (int): number of pages in front of the first heading
+        """
+        key = _toc_offset_key(md_path, template, toc_depth)
+        try:
+            with self._locked():
+                offsets = self._load_toc_offsets()
+                # Keep the offsets in the order they were settled in.
+                offsets.pop(key, None)
+                offsets[key] = offset
+                for old_key in list(offsets)[:-MAX_TOC_OFFSETS]:
+                    del offsets[old_key]
+                write_atomic(
+                    self.directory / TOC_OFFSETS_FILENAME, json.dumps(offsets).encode()
+                )
+        except OSError:
+            pass
+
+    def _load_toc_offsets(self) -> dict:
+        try:
+            return json.loads((self.directory / TOC_OFFSETS_FILENAME).read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _evict(self, manifest: dict) -> None:
+        # Entries missing from the manifest, like those of a process killed
+        # while storing, are never restored.
+        for entry_path in self.directory.glob("*.pdf"):
+            if entry_path.stem not in manifest:
+                entry_path.unlink(missing_ok=True)
+        total_size = sum(entry["size"] for entry in manifest.values())
+        by_last_use = sorted(manifest, key=lambda digest: manifest[digest]["last_used"])
+        for digest in by_last_use:
+            if total_size <= self.max_size:
+                break
+            total_size -= manifest.pop(digest)["size"]
+            self._entry_path(digest).unlink(missing_ok=True)
+
+
+def _toc_offset_key(md_path: Path, template: str, toc_depth: int) -> str:
+    return json.dumps([str(md_path.resolve()), template, toc_depth])
+
+
+def get_output_cache() -> OutputCache | None:
+    """The cache of published pdf files, None when it is turned off."""
+    max_size = get_cache_size()
+    if max_size <= 0:
+        return None
+    return OutputCache(get_cache_directory() / OUTPUT_CACHE_DIRNAME, max_size)
+
+
+@contextmanager
+def replace_atomic(path: Path) -> Iterator[Path]:
+    """Temporary path next to path, moved in place once the block wrote it.
+
+    Readers never see a partially written file, and a file that was at path
+    keeps its content for anything else that opened or copied it.
+
+    Args:
+        path (Path): path of the file to replace
+
+    Yields:
+        Path: path to write the new file to
+    """
+    temp_path = path.with_name(f".tmp-{uuid.uuid4().hex}-{path.name}")
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write to a temporary file next to path and move it in place, so readers
+    never see a partially written file."""
+    with replace_atomic(path) as temp_path:
+        temp_path.write_bytes(data)
+
+
+def copy_atomic(source: Path, destination: Path) -> None:
+    """Copy a file to a temporary file next to destination and move it in place.
+    The copy never shares its data with the source, so writing the destination
+    later leaves the source untouched."""
+    with replace_atomic(destination) as temp_path:
+        shutil.copyfile(source, temp_path)
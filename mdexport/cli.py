@@ -1,6 +1,5 @@
 import click
 from pathlib import Path
-from mdexport.templates import get_available_templates
 
 
 def validate_output_file(ctx: click.Context, param: click.Option, value: str) -> str:
@@ -18,19 +17,69 @@ def validate_md_file(ctx: click.Context, param: click.Parameter, value: str) ->
 
 
 def validate_template(ctx: click.Context, param: click.Option, value: str) -> str:
-    if value is not None and value not in get_available_templates():
-        raise click.BadParameter(
-            f"Please provide a valid template. \n{generate_template_help()}"
-        )
-    return value
+    from mdexport.templates import get_available_templates
+
+    if value is None or value in get_available_templates():
+        return value
+    # The list can miss a template.html added to an existing folder.
+    if value in get_available_templates(refresh=True):
+        return value
+    raise click.BadParameter(
+        f"Please provide a valid template. \n{generate_template_help()}"
+    )
 
 
 def generate_template_help():
+    from mdexport.templates import get_available_templates
+
     template_options = get_available_templates()
     templates_string = ",".join(template_options)
     return f"Provide one of the following templates: {templates_string}"
 
 
+def apply_pdf_profile(ctx: click.Context, param: click.Option, value: str | None):
+    """Publish with this output profile, instead of the one of the template or
+    the config."""
+    if value is not None:
+        from mdexport.config import ConfigStructure, get_config
+
+        get_config().override(ConfigStructure.PDF_PROFILE, value)
+    return value
+
+
+def check_pdf_profile(template: str | None) -> None:
+    """Stop with an error when the pdf profile to publish with, maybe asked for
+    by the template, does not exist."""
+    from mdexport.profiles import UnknownPdfProfileException, get_pdf_options
+
+    try:
+        get_pdf_options(template)
+    except UnknownPdfProfileException as e:
+        click.echo(f"ERROR: {e}")
+        exit(1)
+
+
+def pdf_profile_option(command):
+    from mdexport.profiles import PDF_PROFILES
+
+    return click.option(
+        "--pdf-profile",
+        type=click.Choice(list(PDF_PROFILES)),
+        callback=apply_pdf_profile,
+        expose_value=False,
+        help="Output profile, trading file size for quality and write time.",
+    )(command)
+
+
+class TemplateOption(click.Option):
+    """Option holding a template name. Its help lists the available templates,
+    which are only looked up when the help is actually shown."""
+
+    def get_help_record(self, ctx: click.Context):
+        self.help = generate_template_help()
+        return super().get_help_record(ctx)
+
+
 def validate_template_dir(
     ctx: click.Context, param: click.Parameter, template_dir: str
 ):
@@ -65,3 +114,10 @@ def validate_toc(ctx: click.Context, param: click.Option, toc: int) -> int:
         raise click.BadParameter(
             "Invalid table of content depth. Please provide a number between 1 and 6."
         )
+
+
+def validate_workers(ctx: click.Context, param: click.Option, workers: int) -> int:
+    if workers > 0:
+        return workers
+    else:
+        raise click.BadParameter("Please provide at least 1 worker.")
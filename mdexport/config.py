@@ -1,16 +1,24 @@
 from pathlib import Path
 import os
 import json
+import tempfile
 import click
 from sys import exit
 
 APP_NAME = "mdexport"
 CONFIG_FILENAME = "config.json"
+# MDEXPORT_TEMPLATE_DIR overrides template_dir, and so on for every option.
+ENV_PREFIX = "MDEXPORT_"
 
 
 class ConfigStructure:
     TEMPLATE_DIR = "template_dir"
     ATTACHMENTS_FOLDER = "attachments"
+    TEMPLATE_CACHE = "template_cache"
+    CACHE_SIZE = "cache_size"
+    IMAGE_DPI = "image_dpi"
+    MARKDOWN_ENGINE = "markdown_engine"
+    PDF_PROFILE = "pdf_profile"
 
 
 def get_possible_config_keys() -> list[str]:
@@ -24,44 +32,92 @@ def get_possible_config_keys() -> list[str]:
 DEFAULT_CONFIG = {
     ConfigStructure.TEMPLATE_DIR: "",
     ConfigStructure.ATTACHMENTS_FOLDER: "attachments",
+    ConfigStructure.TEMPLATE_CACHE: "off",
+    ConfigStructure.CACHE_SIZE: "500",
+    ConfigStructure.IMAGE_DPI: "0",
+    ConfigStructure.MARKDOWN_ENGINE: "markdown2",
+    ConfigStructure.PDF_PROFILE: "default",
 }
 
 CONFIG_HELP = {
     ConfigStructure.TEMPLATE_DIR: "Directory where you store your templates. Each template should be in a different folder and contain a template.html file.",
     ConfigStructure.ATTACHMENTS_FOLDER: "If you use a tool like Obsidian that uses wikilinks for images and stores them in a custom subfolder.",
+    ConfigStructure.TEMPLATE_CACHE: "Set to 'on' to keep compiled templates and the list of templates on disk so new mdexport processes do not compile or list them again.",
+    ConfigStructure.CACHE_SIZE: "Maximum size in MB of the cache of published pdf files. Set to 0 to turn the cache off.",
+    ConfigStructure.IMAGE_DPI: "Downscale and recompress embedded images larger than this resolution at full page width. Set to 0 to embed the original images.",
+    ConfigStructure.MARKDOWN_ENGINE: "Converter of the markdown: 'markdown2' or the faster 'markdown-it', which needs the markdown-it extra installed.",
+    ConfigStructure.PDF_PROFILE: "Output profile of the pdf files: 'default', 'screen' and 'print' for smaller images, 'archive' for PDF/A or 'draft' for the fastest write. A template can pick its own profile.",
 }
 
+TRUE_VALUES = ["on", "true", "yes", "1"]
+
 
 class InvalidKeyException(Exception):
     pass
 
 
 class Config:
-    config = {}
+    """The options of mdexport.
+
+    Loading never writes: missing options get their default in memory and
+    environment variables override the config file. Only set writes the
+    config file, replacing it at once so other processes never read it half
+    written.
+
+    Attributes:
+        config (dict): the options in effect
+        stored (dict): the options in the config file
+        overrides (dict): options overridden for this process
+    """
 
     def __init__(self):
-        if not (_get_config_directory() / CONFIG_FILENAME).is_file():
-            json_string = json.dumps(DEFAULT_CONFIG)
-            (_get_config_directory() / CONFIG_FILENAME).write_text(json_string)
+        self.config = {}
+        self.stored = {}
+        self.overrides = {}
 
     def load(self):
-        with open(_get_config_directory() / CONFIG_FILENAME, "r") as config_file:
-            self.config = json.load(config_file)
+        try:
+            with open(_get_config_directory() / CONFIG_FILENAME, "r") as config_file:
+                self.stored = json.load(config_file)
+        except FileNotFoundError:
+            self.stored = {}
         for key in get_possible_config_keys():
-            if key not in self.config.keys():
-                self.set(key, DEFAULT_CONFIG[key])
+            env_value = os.environ.get(f"{ENV_PREFIX}{key.upper()}")
+            if env_value is not None:
+                self.overrides[key] = env_value
+        self._merge()
 
     def save(self) -> None:
-        with open(_get_config_directory() / CONFIG_FILENAME, "w") as config_file:
-            json.dump(self.config, config_file)
+        config_dir = _get_config_directory()
+        config_dir.mkdir(parents=True, exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=config_dir, prefix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "w") as config_file:
+                json.dump(self.stored, config_file)
+            os.replace(temp_path, config_dir / CONFIG_FILENAME)
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
 
     def set(self, key, value):
-        if key in get_possible_config_keys():
-            self.config[key] = value
-            self.save()
-        else:
+        self._check_key(key)
+        self.stored[key] = value
+        self.save()
+        self._merge()
+
+    def override(self, key, value):
+        """Use a value for this process only, without changing the config file."""
+        self._check_key(key)
+        self.overrides[key] = value
+        self._merge()
+
+    def _merge(self) -> None:
+        self.config = {**DEFAULT_CONFIG, **self.stored, **self.overrides}
+
+    def _check_key(self, key):
+        if key not in get_possible_config_keys():
             raise InvalidKeyException(
-                """{key} is not a valid options. Use 'mdexports options list' to see a list of valid option keys."""
+                f"""{key} is not a valid options. Use 'mdexports options list' to see a list of valid option keys."""
             )
 
     def pre_publish_config_check(self):
@@ -86,6 +142,37 @@ Inside the should be a Jinja2 template named "template.html"
 {APP_NAME} options set {ConfigStructure.TEMPLATE_DIR} /path/to/templates/
 Your template directory should hold only folders named with the template name.
 Inside the should be a Jinja2 template named "template.html"                  
+"""
+            )
+            exit()
+
+        from mdexport.engines import MARKDOWN_ENGINES
+
+        engine = self.config.get(
+            ConfigStructure.MARKDOWN_ENGINE,
+            DEFAULT_CONFIG[ConfigStructure.MARKDOWN_ENGINE],
+        )
+        if engine not in MARKDOWN_ENGINES:
+            click.echo(
+                f"""ERROR: Unknown markdown engine set in the configurations.
+Please run:
+{APP_NAME} options set {ConfigStructure.MARKDOWN_ENGINE} <engine>
+with one of: {", ".join(MARKDOWN_ENGINES)}
+"""
+            )
+            exit()
+
+        from mdexport.profiles import PDF_PROFILES
+
+        profile = self.config.get(
+            ConfigStructure.PDF_PROFILE, DEFAULT_CONFIG[ConfigStructure.PDF_PROFILE]
+        )
+        if profile not in PDF_PROFILES:
+            click.echo(
+                f"""ERROR: Unknown pdf profile set in the configurations.
+Please run:
+{APP_NAME} options set {ConfigStructure.PDF_PROFILE} <profile>
+with one of: {", ".join(PDF_PROFILES)}
 """
             )
             exit()
@@ -102,11 +189,27 @@ def _get_config_directory() -> Path:
     else:
         raise OSError("Unsupported operating system")
 
-    # Create the directory if it doesn't exist
-    config_dir.mkdir(parents=True, exist_ok=True)
     return config_dir
 
 
+def get_cache_directory() -> Path:
+    """Get the directory mdexport keeps its caches in, creating it if needed.
+
+    Returns:
+        Path: cache directory
+    """
+    if os.name == "nt":  # Windows
+        cache_dir = Path.home() / "AppData" / "Local" / APP_NAME / "cache"
+    elif os.name == "posix":  # macOS and Linux
+        cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+        cache_dir = Path(cache_home) / APP_NAME
+    else:
+        raise OSError("Unsupported operating system")
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
 class TemplateDirNotSetException(Exception):
     pass
 
@@ -118,6 +221,7 @@ def get_templates_directory() -> Path:
         Path: Path to the directory holding the templates
     """
 
+    config = get_config()
     if ConfigStructure.TEMPLATE_DIR in config.config.keys():
         return Path(config.config[ConfigStructure.TEMPLATE_DIR])
     else:
@@ -125,8 +229,67 @@ def get_templates_directory() -> Path:
 
 
 def get_attachment_dir() -> Path:
-    return Path(config.config[ConfigStructure.ATTACHMENTS_FOLDER])
+    return Path(get_config().config[ConfigStructure.ATTACHMENTS_FOLDER])
+
+
+def get_cache_size() -> int:
+    """Maximum size of the published pdf cache in bytes."""
+    return int(float(get_config().config[ConfigStructure.CACHE_SIZE]) * 1024 * 1024)
+
+
+def get_relevant_config() -> dict:
+    """The options that change what a publish renders."""
+    config = get_config()
+    return {
+        ConfigStructure.TEMPLATE_DIR: config.config[ConfigStructure.TEMPLATE_DIR],
+        ConfigStructure.ATTACHMENTS_FOLDER: config.config[
+            ConfigStructure.ATTACHMENTS_FOLDER
+        ],
+        ConfigStructure.IMAGE_DPI: get_image_dpi(),
+        ConfigStructure.MARKDOWN_ENGINE: get_markdown_engine_name(),
+        ConfigStructure.PDF_PROFILE: config.config[ConfigStructure.PDF_PROFILE],
+    }
+
+
+def get_image_dpi() -> int:
+    """Resolution images are downscaled to, 0 when they are embedded as is."""
+    return int(get_config().config[ConfigStructure.IMAGE_DPI])
 
 
-config = Config()
-config.load()
+def get_markdown_engine_name() -> str:
+    return get_config().config[ConfigStructure.MARKDOWN_ENGINE]
+
+
+def template_cache_enabled() -> bool:
+    return str(get_config().config[ConfigStructure.TEMPLATE_CACHE]).lower() in TRUE_VALUES
+
+
+_config = None
+
+
+def get_config() -> Config:
+    """The loaded configuration, read on first use instead of at import."""
+    global _config
+    if _config is None:
+        _config = Config()
+        _config.load()
+    return _config
+
+
+def use_config(stored: dict, overrides: dict) -> None:
+    """Use options loaded by the parent process, so worker processes do not
+    read the config file again.
+
+    The options of the config file and those overridden for this run are kept
+    apart, like in the parent, so an option only counts as given for this run
+    when it was.
+
+    Args:
+        stored (dict): the options in the config file of the parent process
+        overrides (dict): the options overridden in the parent process
+    """
+    global _config
+    _config = Config()
+    _config.stored = dict(stored)
+    _config.overrides = dict(overrides)
+    _config._merge()
@@ -1,23 +1,143 @@
-from mdexport.markdown import convert_md_to_html, extract_md_metadata
+from mdexport.markdown import (
+    MarkdownDocument,
+    parse_md_file,
+    generate_toc,
+    generate_no_page_nr_css,
+    get_heading_pages,
+    get_toc_offset,
+)
 from mdexport.templates import (
     fill_template,
     match_metadata_to_template,
+    template_uses_toc,
     ExpectedMoreMetaDataException,
 )
+from mdexport.exporter import write_render_html, write_document_to_pdf
+from mdexport.cache import compute_publish_digest, get_output_cache
+from mdexport.timings import stage
 from pathlib import Path
 import click
+import weasyprint
+
+# Upper bound on layouts of one document while settling the table of content.
+MAX_LAYOUT_PASSES = 3
 
 
 def generate_renderable_html(
-    md_content: str, md_path: Path, template: str | None, toc_html=None
+    md_document: MarkdownDocument, template: str | None, toc_html=None
 ):
-    html_content = convert_md_to_html(md_content, md_path)
-    metadata = extract_md_metadata(md_path)
+    html_content = md_document.html
+    metadata = dict(md_document.metadata)
     if toc_html:
         metadata["toc"] = toc_html
+    return fill_template(template, html_content, metadata) if template else html_content
+
+
+def warn_missing_metadata(md_document: MarkdownDocument, template: str | None):
     if template:
         try:
-            match_metadata_to_template(template, metadata.keys())
+            match_metadata_to_template(template, md_document.metadata.keys())
         except ExpectedMoreMetaDataException as e:
             click.echo(f"!!!!! WARNING: {e}")
-    return fill_template(template, html_content, metadata) if template else html_content
+
+
+def render_document(
+    md_document: MarkdownDocument,
+    template: str | None,
+    toc_depth: int,
+    offset: int = 0,
+) -> tuple[weasyprint.Document, int]:
+    """Lay out a markdown file, with its table of content, as a WeasyPrint document.
+
+    The table of content gets its page numbers from WeasyPrint during layout, so
+    the first layout is normally the final one. Only the pages in front of the
+    first heading depend on the layout: they are unnumbered and the page count
+    restarts after them. When that offset differs from the one the document was
+    laid out with, it is laid out again with the measured offset, at most
+    MAX_LAYOUT_PASSES times. Passing the offset of an earlier render of the same
+    file as a first guess saves that extra layout.
+
+    Args:
+        md_document (MarkdownDocument): parsed markdown file
+        template (str | None): template name
+        toc_depth (int): deepest heading level in the table of content
+        offset (int): first guess of the number of pages before the first heading
+
+    Returns:
+        tuple[weasyprint.Document, int]: document ready to be written to pdf and
+        the offset it was laid out with
+    """
+    warn_missing_metadata(md_document, template)
+    toc_html = generate_toc(md_document, toc_depth)
+    places_toc = template is not None and template_uses_toc(template)
+    for _ in range(MAX_LAYOUT_PASSES):
+        no_page_nr_css = generate_no_page_nr_css(offset) if offset else ""
+        filled_template = generate_renderable_html(
+            md_document, template, no_page_nr_css + toc_html
+        )
+        rendered_document = write_render_html(template, filled_template)
+        if not places_toc:
+            # The offset only takes effect through the toc template variable.
+            return rendered_document, offset
+        heading_pages = get_heading_pages(
+            rendered_document, [heading_id for _, heading_id, _ in md_document.headers]
+        )
+        measured_offset = get_toc_offset(heading_pages)
+        if measured_offset == offset:
+            return rendered_document, offset
+        offset = measured_offset
+    return rendered_document, offset
+
+
+def publish_md_file(
+    md_path: Path,
+    output: Path,
+    template: str | None,
+    toc_depth: int,
+    use_cache: bool = False,
+    refresh: bool = False,
+) -> bool:
+    """Publish a markdown file to a pdf file.
+
+    With the cache, a pdf published before from the same input is reused
+    instead of rendered again. The cache also keeps the number of pages in
+    front of the first heading the note settled at last time, the first guess
+    of the layout, so a note with a cover or table of content page is laid out
+    once when that number did not change.
+
+    Args:
+        md_path (Path): path to the markdown file
+        output (Path): path of the pdf file
+        template (str | None): template name
+        toc_depth (int): deepest heading level in the table of content
+        use_cache (bool): reuse and store pdf files in the output cache
+        refresh (bool): render even when the cache has the pdf, and replace it
+
+    Returns:
+        bool: whether the pdf was taken from the cache
+    """
+    output_cache = get_output_cache() if use_cache else None
+    if output_cache:
+        with stage("cache"):
+            digest = compute_publish_digest(md_path, template, toc_depth)
+            if not refresh and output_cache.restore(digest, output):
+                return True
+    md_document = parse_md_file(md_path)
+    remember_offset = output_cache is not None and template is not None
+    offset = (
+        output_cache.load_toc_offset(md_path, template, toc_depth)
+        if remember_offset
+        else 0
+    )
+    rendered_document, settled_offset = render_document(
+        md_document, template, toc_depth, offset
+    )
+    write_document_to_pdf(rendered_document, output, template)
+    if output_cache:
+        with stage("cache"):
+            output_cache.store(digest, output)
+            if remember_offset and settled_offset != offset:
+                output_cache.save_toc_offset(
+                    md_path, template, toc_depth, settled_offset
+                )
+    return False
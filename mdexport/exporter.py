@@ -1,16 +1,24 @@
 import weasyprint
 import click
-from uuid import uuid4
 from pathlib import Path
 from mdexport.templates import (
     get_templates_directory,
     TemplateDirNotSetException,
     APP_NAME,
 )
-import re
-
-BASE_STYLE_HTML = """
-<style>
+from mdexport.cache import replace_atomic
+from mdexport.profiles import get_pdf_options
+from mdexport.timings import timed
+from weasyprint.text.fonts import FontConfiguration
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from urllib.request import url2pathname
+
+# Bytes of fetched resources kept in memory for later renders in this process.
+FETCH_CACHE_SIZE = 64 * 1024 * 1024
+
+# Passed to WeasyPrint as a user stylesheet: templates override it.
+BASE_STYLE_CSS = """
 img {
   max-width: 100%;
 }
@@ -42,80 +50,135 @@ display:none !important;
     justify-content: space-between;
     }
 }
+.mdexport-toc-item::after {
+    content: "p." target-counter(attr(href url), page);
+}
+.mdexport-toc-item[data-page]::after {
+    content: "p." attr(data-page);
+}
 @page {
     @bottom-right {
         font-family: Arial, sans-serif;
         content: counter(page);
     }
 }
-</style>
 """
 
 
-class MissingHTMLTagException(Exception):
-    pass
+_font_config = None
+_base_stylesheet = None
 
 
-def insert_base_style(html_text: str) -> str:
-    """Insert the BASE_STYLE_HTML into the html string. Base style insures
-    basic restraints like image size. Style is insert before end of the </head>
-    tag or if it is not preset straight after opening <html> tag
+def get_font_config() -> FontConfiguration:
+    """Font configuration shared by every render in this process, so fonts are
+    only discovered once per process instead of once per render."""
+    global _font_config
+    if _font_config is None:
+        _font_config = FontConfiguration()
+    return _font_config
 
-    Args:
-        html_text (str): html string
 
-    Returns:
-        str: html string with base style injected
-    """
-    if "</head>" in html_text.lower():
-        html_text = re.sub(
-            "</head>", f"</head>\n{BASE_STYLE_HTML}\n", html_text, flags=re.IGNORECASE
-        )
-    elif "<html>" in html_text.lower():
-        html_text = re.sub(
-            "<html>", f"<html>\n{BASE_STYLE_HTML}\n", html_text, flags=re.IGNORECASE
+def get_base_stylesheet() -> weasyprint.CSS:
+    """The base style, parsed once per process. Base style ensures basic
+    restraints like image size and numbers the pages."""
+    global _base_stylesheet
+    if _base_stylesheet is None:
+        _base_stylesheet = weasyprint.CSS(
+            string=BASE_STYLE_CSS, font_config=get_font_config()
         )
-    else:
-        html_text = f"""<html>
-        <meta charset="UTF-8" />
-        <meta name="viewport" content="width=device-width, initial-scale=1.0" />
-        <head>
-            {BASE_STYLE_HTML}
-        </head>
-        <body>
-            {html_text}
-        </body>
-        </html>
-        """
+    return _base_stylesheet
 
-    return html_text
 
+class FetchCache:
+    """url_fetcher that keeps local files WeasyPrint fetched in memory.
 
-"""
-def write_html_to_pdf(html_content: str, output: Path) -> None:
-    html_content = insert_base_style(html_content)
-    # base_url refers to the highest root directory. Required to render absolute path image paths
-    weasyprint.HTML(string=html_content, base_url=Path.cwd().root).write_pdf(output)
-"""
+    Entries are keyed by path, modification time and size, so an edited image or
+    stylesheet is read again. The least recently used entries are dropped once
+    the cached files take more than max_size bytes. Remote urls are not cached.
+    """
 
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, dict] = OrderedDict()
 
-def write_render_html(
-    template: str | None, filled_template: str
-) -> weasyprint.Document:
-    """
-    TODO: setup context manager to write the html
+    def fetch(self, url: str, timeout: int = 10, ssl_context=None) -> dict:
+        """Fetch an url like weasyprint.default_url_fetcher does.
+
+        Args:
+            url (str): url of the resource
+            timeout (int): seconds before fetching a remote url is given up
+            ssl_context: ssl context used for remote urls
+
+        Returns:
+            dict: the fetched resource, as expected by WeasyPrint
+        """
+        split_url = urlsplit(url)
+        if split_url.scheme != "file":
+            return weasyprint.default_url_fetcher(url, timeout, ssl_context)
+        path = url2pathname(split_url.path)
+        try:
+            stat = Path(path).stat()
+        except OSError:
+            return weasyprint.default_url_fetcher(url, timeout, ssl_context)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return dict(self._entries[key])
+        self.misses += 1
+        result = weasyprint.default_url_fetcher(url, timeout, ssl_context)
+        if "file_obj" in result:
+            with result.pop("file_obj") as file_obj:
+                result["string"] = file_obj.read()
+        self._store(key, result)
+        return dict(result)
+
+    def _store(self, key: tuple, result: dict) -> None:
+        entry_size = len(result["string"])
+        if entry_size > self.max_size:
+            return
+        self._entries[key] = result
+        self.size += entry_size
+        while self.size > self.max_size:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted["string"])
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "size": self.size,
+        }
+
+
+_fetch_cache = None
+
+
+def get_fetch_cache() -> FetchCache:
+    """Fetch cache shared by every render in this process: the table of content
+    pass, the final render and every document of a batch or daemon."""
+    global _fetch_cache
+    if _fetch_cache is None:
+        _fetch_cache = FetchCache(FETCH_CACHE_SIZE)
+    return _fetch_cache
+
+
+def get_base_url(template: str | None) -> str:
+    """Base url that relative urls in a filled template resolve against: the
+    folder of the template, or the template directory without a template.
+
+    Args:
+        template (str | None): template name
+
+    Returns:
+        str: path of the folder
     """
     try:
-        filled_template = insert_base_style(filled_template)
-        render_file = f".{uuid4()}.html"
-        if not template:
-            template = ""
-            filled_template = insert_base_style(filled_template)
-        render_full_path = get_templates_directory() / template / render_file
-        render_full_path.write_text(filled_template)
-        rendered_document = weasyprint.HTML(render_full_path).render()
-        render_full_path.unlink()
-        return rendered_document
+        return str(get_templates_directory() / (template or ""))
     except TemplateDirNotSetException:
         click.echo(
             f"""ERROR: Template directory not set in mdexport config.
@@ -128,34 +191,57 @@ Inside the should be a Jinja2 template named "template.html"
         exit()
 
 
-def write_template_to_pdf(
-    template: str | None, filled_template: str, output: Path
+def create_html(template: str | None, filled_template: str) -> weasyprint.HTML:
+    """Parse the filled out template straight from memory.
+
+    Args:
+        template (str | None): template name
+        filled_template (str): html string, or an html fragment without template
+
+    Returns:
+        weasyprint.HTML: html document with urls relative to the template folder
+    """
+    return weasyprint.HTML(
+        string=filled_template,
+        base_url=get_base_url(template),
+        url_fetcher=get_fetch_cache().fetch,
+    )
+
+
+@timed("layout")
+def write_render_html(
+    template: str | None, filled_template: str
+) -> weasyprint.Document:
+    """Lay out the filled out template.
+
+    Args:
+        template (str | None): template name
+        filled_template (str): html string
+
+    Returns:
+        weasyprint.Document: laid out document
+    """
+    return create_html(template, filled_template).render(
+        font_config=get_font_config(),
+        stylesheets=[get_base_stylesheet()],
+        **get_pdf_options(template),
+    )
+
+
+@timed("pdf")
+def write_document_to_pdf(
+    rendered_document: weasyprint.Document, output: Path, template: str | None = None
 ) -> None:
-    """Writes the filled out html template to a uuid named html file in the template folder
-    and renders it to the output path as a pdf.
+    """Write an already laid out document to the output path as a pdf.
+
+    The pdf is written next to the output and moved in place, so a pdf that was
+    there, or a copy of it, is never written through.
 
     Args:
-        template (str): _description_
-        filled_template (str): _description_
-        output (Path): _description_
+        rendered_document (weasyprint.Document): document to write
+        output (Path): path of the pdf file
+        template (str | None): template the document was laid out in, for its
+            output profile
     """
-    try:
-        filled_template = insert_base_style(filled_template)
-        render_file = f".{uuid4()}.html"
-        if not template:
-            template = ""
-            filled_template = insert_base_style(filled_template)
-        render_full_path = get_templates_directory() / template / render_file
-        render_full_path.write_text(filled_template)
-        weasyprint.HTML(render_full_path).write_pdf(output)
-        render_full_path.unlink()
-    except TemplateDirNotSetException:
-        click.echo(
-            f"""ERROR: Template directory not set in mdexport config.
-Please run:
-{APP_NAME} settemplatedir /path/to/templates/
-Your template directory should hold only folders named with the template name.
-Inside the should be a Jinja2 template named "template.html"  
-            """
-        )
-        exit()
+    with replace_atomic(output) as temp_output:
+        rendered_document.write_pdf(temp_output, **get_pdf_options(template))
@@ -0,0 +1,105 @@
+from io import BytesIO
+from pathlib import Path
+import hashlib
+import os
+import re
+
+from mdexport.config import get_cache_directory
+from mdexport.timings import timed
+
+IMAGE_CACHE_DIRNAME = "images"
+# Widest an image is displayed: the content width of an A4 or letter page with
+# the default WeasyPrint margins, in inches.
+DISPLAY_WIDTH = 7
+JPEG_QUALITY = 85
+# Bump when a change here changes the derivatives written for the same image.
+DERIVATIVE_VERSION = "1"
+# Matches the src of <img> tags, as written by markdown2 and rewrite_embed.
+IMG_SRC_PATTERN = r'(<img\b[^>]*?\bsrc=")([^"]+)(")'
+# Formats that are downscaled, the others are embedded as is.
+DOWNSCALED_FORMATS = ["JPEG", "PNG", "WEBP"]
+EXIF_ORIENTATION = 0x0112
+ROTATED_ORIENTATIONS = [5, 6, 7, 8]
+
+
+def get_derivative(image_path: Path, dpi: int, cache_dir: Path) -> Path:
+    """Downscaled and recompressed copy of an image, from the cache if possible.
+
+    Derivatives are stored by the hash of the original image content, so a
+    later publish, or another note embedding the same image, reuses them.
+
+    Args:
+        image_path (Path): original image
+        dpi (int): resolution of the image at full page width
+        cache_dir (Path): directory the derivatives are stored in
+
+    Returns:
+        Path: the derivative, or the original image when it is already small
+        enough or cannot be downscaled
+    """
+    # Imported here, only publishes that downscale images need Pillow.
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    image_bytes = image_path.read_bytes()
+    digest = hashlib.sha256(image_bytes)
+    digest.update(f":{DERIVATIVE_VERSION}:{dpi}:{JPEG_QUALITY}".encode())
+    derivative_path = cache_dir / f"{digest.hexdigest()}{image_path.suffix.lower()}"
+    if derivative_path.is_file():
+        return derivative_path
+
+    max_width = DISPLAY_WIDTH * dpi
+    try:
+        image = Image.open(BytesIO(image_bytes))
+    except UnidentifiedImageError:
+        return image_path
+    if image.format not in DOWNSCALED_FORMATS:
+        return image_path
+    width = image.width
+    if image.getexif().get(EXIF_ORIENTATION) in ROTATED_ORIENTATIONS:
+        width = image.height
+    if width <= max_width:
+        return image_path
+
+    image_format = image.format
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_width, image.height), Image.Resampling.LANCZOS)
+    derivative = BytesIO()
+    if image_format == "JPEG":
+        if image.mode not in ["RGB", "L", "CMYK"]:
+            image = image.convert("RGB")
+        image.save(derivative, image_format, quality=JPEG_QUALITY, optimize=True)
+    elif image_format == "WEBP":
+        image.save(derivative, image_format, quality=JPEG_QUALITY)
+    else:
+        image.save(derivative, image_format, optimize=True)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Write next to the derivative and move it in place, concurrent publishes
+    # never see a partially written image.
+    temp_path = derivative_path.with_name(f".{derivative_path.name}.{os.getpid()}")
+    temp_path.write_bytes(derivative.getvalue())
+    os.replace(temp_path, derivative_path)
+    return derivative_path
+
+
+@timed("images")
+def downscale_images(html_text: str, dpi: int) -> str:
+    """Point the <img> tags for local images at their downscaled derivative.
+
+    Args:
+        html_text (str): html with absolute image paths
+        dpi (int): resolution of an image at full page width
+
+    Returns:
+        str: html using derivatives where the originals are too large
+    """
+    cache_dir = get_cache_directory() / IMAGE_CACHE_DIRNAME
+
+    def replace_src(match):
+        image_path = Path(match.group(2))
+        if not image_path.is_absolute() or not image_path.is_file():
+            return match.group(0)
+        derivative_path = get_derivative(image_path, dpi, cache_dir)
+        return f"{match.group(1)}{derivative_path}{match.group(3)}"
+
+    return re.sub(IMG_SRC_PATTERN, replace_src, html_text)
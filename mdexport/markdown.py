@@ -1,16 +1,37 @@
-import markdown2
 import frontmatter
-from bs4 import BeautifulSoup
+from functools import lru_cache
 from pathlib import Path
+from typing import Callable, List, TYPE_CHECKING
 import re
+import html
 from mdexport.templates import get_variables_from_template
-from mdexport.config import get_attachment_dir
-from mdexport.exporter import write_render_html
-from typing import Callable
-
-
-ATTACHMENT_DIRECTORY = get_attachment_dir()
-MARKDOWN_EXTRAS = ["tables", "toc", "fenced-code-blocks"]
+from mdexport.config import get_attachment_dir, get_image_dpi
+from mdexport.engines import get_markdown_engine
+from mdexport.timings import stage, timed
+
+if TYPE_CHECKING:
+    import weasyprint
+
+
+# Matches ![alt](path) and captures the alt text and the path
+IMAGE_PATTERN = r"!\[(.*?)\]\((.*?)\)"
+# Matches ![[filename]] wikilink embeds of images and captures the filename
+EMBED_PATTERN = r"!\[\[(.*\.(?:jpg|jpeg|png|gif|bmp|tiff|tif|webp|svg|ico|heif|heic|raw|psd|ai|eps|indd|jfif))\]\]"
+URL_PATTERN = re.compile(r"https?://")
+# Matches both, an embed captures group 1 and an image groups 2 and 3.
+REFERENCE_PATTERN = re.compile(f"{EMBED_PATTERN}|{IMAGE_PATTERN}")
+# Size of the caches of resolved paths, per directory and per file.
+RESOLVE_CACHE_SIZE = 4096
+# Matches text the markdown engine could turn into more than a paragraph of
+# escaped text.
+MARKDOWN_SYNTAX_PATTERN = r"[\\`*_\[\]<>!|~\n\t]|&#?\w+;|^[\s+\-#>=]|^\d+[.)]"
+# Separates metadata values converted together in a single conversion.
+METADATA_SEPARATOR = "<!-- mdexport-metadata-value -->"
+# Matches markdown whose html depends on the rest of the text it is converted
+# with: link reference definitions, and headings, whose ids are made unique.
+SHARED_STATE_PATTERN = re.compile(
+    r"^ {0,3}\[[^\]]+\]:|^ {0,3}#{1,6}(?:\s|$)|^ {0,3}(?:=+|-+)\s*$", re.MULTILINE
+)
 
 
 def generate_empty_md(output_file: Path, template: str):
@@ -23,92 +44,302 @@ def generate_empty_md(output_file: Path, template: str):
 
 
 def convert_metadata_to_html(metadata):
-    html = markdown2.markdown(metadata, extras=MARKDOWN_EXTRAS)
-    if html.startswith("<p>"):
-        html = html[3:]
-    if html.endswith("</p>\n"):
-        html = html[:-5]
-    return html
+    return strip_paragraph(get_markdown_engine().convert(metadata)[0])
+
+
+def is_plain_text(value: str) -> bool:
+    """Whether the markdown engine would only escape the value and wrap it in a
+    paragraph."""
+    return re.search(MARKDOWN_SYNTAX_PATTERN, value) is None
+
+
+def convert_metadata_values_to_html(values: List[str]) -> List[str]:
+    """Convert many metadata values with a single markdown conversion.
+
+    Values with link reference definitions or headings are converted on their
+    own, in a shared conversion they would change the html of other values.
+
+    Args:
+        values (List[str]): markdown values
+
+    Returns:
+        List[str]: html of every value, like convert_metadata_to_html returns
+    """
+    converted = {
+        index: convert_metadata_to_html(value)
+        for index, value in enumerate(values)
+        if SHARED_STATE_PATTERN.search(value)
+    }
+    batched = [index for index in range(len(values)) if index not in converted]
+    if len(batched) > 1:
+        html_text, _ = get_markdown_engine().convert(
+            f"\n\n{METADATA_SEPARATOR}\n\n".join(values[index] for index in batched)
+        )
+        chunks = html_text.split(METADATA_SEPARATOR)
+        # Unless a value swallowed a separator, like an unclosed code block,
+        # then they are converted one by one.
+        if len(chunks) == len(batched):
+            for index, chunk in zip(batched, chunks):
+                chunk = chunk.strip()
+                converted[index] = strip_paragraph(f"{chunk}\n" if chunk else "")
+    return [
+        converted[index] if index in converted else convert_metadata_to_html(value)
+        for index, value in enumerate(values)
+    ]
+
+
+def strip_paragraph(html_text: str) -> str:
+    if html_text.startswith("<p>"):
+        html_text = html_text[3:]
+    if html_text.endswith("</p>\n"):
+        html_text = html_text[:-5]
+    return html_text
+
+
+@timed("metadata")
+def convert_metadata(metadata: dict) -> dict:
+    """Convert the frontmatter metadata for the template.
+
+    Plain text values are only escaped, values with markdown are converted to
+    html together. Values in lists and mappings are converted the same way,
+    other values like numbers, dates and booleans are kept as they are and empty
+    values become an empty string.
+
+    Args:
+        metadata (dict): frontmatter metadata
+
+    Returns:
+        dict: metadata with its text values converted to html
+    """
+    markdown_values = []
+
+    def collect(value):
+        if isinstance(value, str):
+            if not is_plain_text(value):
+                markdown_values.append(value)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                collect(item)
+        elif isinstance(value, dict):
+            for item in value.values():
+                collect(item)
+
+    collect(metadata)
+    converted_values = iter(convert_metadata_values_to_html(markdown_values))
+
+    def convert(value):
+        if isinstance(value, str):
+            if is_plain_text(value):
+                return html.escape(value, quote=False)
+            return next(converted_values)
+        if isinstance(value, (list, tuple)):
+            return [convert(item) for item in value]
+        if isinstance(value, dict):
+            return {key: convert(item) for key, item in value.items()}
+        if value is None:
+            return ""
+        return value
+
+    return convert(metadata)
 
 
 def extract_md_metadata(md_file: Path) -> dict:
-    # TODO: figure out all md works as values
-    metadata = frontmatter.load(md_file).metadata
-    return {key: convert_metadata_to_html(md) for key, md in metadata.items()}
+    return convert_metadata(frontmatter.load(md_file).metadata)
 
 
 def read_md_file(md_file: Path) -> str:
     return frontmatter.load(md_file).content
 
 
-def convert_md_to_html(md_content: str, md_path: Path) -> str:
-    attachment_path = get_base_path(md_path)
-    md_content = embed_to_img_tag(md_content, attachment_path)
-    md_content = md_relative_img_to_absolute(md_content, md_path)
-    html_text = markdown2.markdown(md_content, extras=MARKDOWN_EXTRAS)
-    return html_text
+class MarkdownDocument:
+    """A markdown file parsed once for the whole publish pipeline.
+
+    Attributes:
+        md_path (Path): path to the markdown file
+        metadata (dict): frontmatter metadata with its values converted to html
+        content (str): markdown text without the frontmatter
+        html (str): content converted to html
+        headers (list): (level, id, html text) of every heading, in order
+        toc_html (str): nested list linking to every heading, "" without headings
+    """
+
+    def __init__(
+        self,
+        md_path: Path,
+        metadata: dict,
+        content: str,
+        html: str,
+        headers: list,
+        toc_html: str,
+    ):
+        self.md_path = md_path
+        self.metadata = metadata
+        self.content = content
+        self.html = html
+        self.headers = headers
+        self.toc_html = toc_html
+
+
+def parse_md_file(md_path: Path) -> MarkdownDocument:
+    """Read the frontmatter and convert the markdown of a file, once.
+
+    Args:
+        md_path (Path): path to the markdown file
+
+    Returns:
+        MarkdownDocument: the parsed file
+    """
+    with stage("frontmatter"):
+        post = frontmatter.load(md_path)
+    html_text, headers = convert_md(post.content, md_path)
+    return MarkdownDocument(
+        md_path,
+        convert_metadata(post.metadata),
+        post.content,
+        html_text,
+        headers,
+        generate_toc_from_headers(headers, 6),
+    )
 
 
-def filter_depth(toc_html: str, depth: int) -> str:
-    soup = BeautifulSoup(toc_html, "html.parser")
+@timed("markdown")
+def convert_md(md_content: str, md_path: Path) -> tuple[str, list]:
+    """Convert markdown to html, with the markdown engine set in the config, and
+    collect its headings.
 
-    def prune_ul(tag, current_depth):
-        # If the current tag is a <ul> and exceeds the specified depth, remove it
-        if tag.name == "ul" and current_depth > depth:
-            tag.decompose()  # Remove the deeply nested <ul>
-        else:
-            # Recursively go through all children (not just <ul> tags)
-            for child in tag.find_all(True, recursive=False):  # Only direct children
-                prune_ul(child, current_depth + (1 if child.name == "ul" else 0))
+    Args:
+        md_content (str): markdown text without the frontmatter
+        md_path (Path): path to the markdown file, images are relative to it
+
+    Returns:
+        tuple[str, list]: html and the (level, id, html text) of every heading
+    """
+    md_content = preprocess_md(md_content, md_path)
+    html_text, headers = get_markdown_engine().convert(md_content)
+    image_dpi = get_image_dpi()
+    if image_dpi > 0:
+        from mdexport.images import downscale_images
 
-    # Loop through all top-level tags and start pruning from each one
-    for tag in soup.find_all(True, recursive=False):  # Find all tags at the top level
-        prune_ul(tag, 1)
+        html_text = downscale_images(html_text, image_dpi)
+    return html_text, headers
 
-    return str(soup)
+
+def convert_md_to_html(md_content: str, md_path: Path) -> str:
+    return convert_md(md_content, md_path)[0]
 
 
+@timed("table of content")
 def generate_toc(
-    renderer: Callable, md_content: str, md_path: Path, depth: int, template: str | None
-):
-    toc_html = markdown2.markdown(md_content, extras=MARKDOWN_EXTRAS).toc_html
-    # TODO: feed empty file and solve error
-    toc_html = filter_depth(toc_html, depth)
-
-    test_render_toc = f"""<section class="mdexport-toc-container">
-        {toc_html}
-</section>
-"""
-
-    renderable_content = renderer(md_content, md_path, template, test_render_toc)
-    rendered_document = write_render_html(template, renderable_content)
-    heading_pages = {}
-    offset = None
-    for page_number, page in enumerate(rendered_document.pages, start=1):
-        for box in page._page_box.descendants():
-            # Check for headings (e.g., H1, H2, ...)
-            if box.element_tag in {"h1", "h2", "h3", "h4", "h5", "h6"}:
-                if not offset:
-                    offset = page_number - 1
-                element_id = box.element.get("id")
-                heading_pages[element_id] = page_number - offset
-
-    def replace_link(match):
-        href = match.group(1)  # The href value
-        text = match.group(2)  # The inner text of the <a> tag
-        # Extract the page number from the heading_pages using the href (without #)
-        page_number = heading_pages.get(href.lstrip("#"), "N/A")
-        return f'<a href="{href}" class="mdexport-toc-item"><span>{text}</span> <span>p.{page_number}</span></a>'
-
-    updated_toc = re.sub(r'<a href="([^"]+)">([^<]+)</a>', replace_link, str(toc_html))
-    combined_no_page_nr_style = generate_no_page_nr_css(offset) if offset else ""
+    md_document: MarkdownDocument, depth: int, heading_pages: dict | None = None
+) -> str:
+    """Generate the table of content section for a markdown document.
+
+    The page numbers are not filled in here. Each entry links to its heading
+    and the base style prints the page of that target with target-counter(),
+    so WeasyPrint resolves them while laying out the document. The content of
+    the table of content therefore does not depend on a previous layout.
+
+    Headings nested more than depth lists deep are left out.
+
+    Args:
+        md_document (MarkdownDocument): parsed markdown file
+        depth (int): deepest heading level to include
+        heading_pages (dict | None): page number of every heading id, for a
+            table of content laid out apart from its headings
+
+    Returns:
+        str: html section holding the table of content
+    """
+    return generate_toc_from_headers(md_document.headers, depth, heading_pages)
+
+
+def generate_toc_from_headers(
+    headers: list, depth: int, heading_pages: dict | None = None
+) -> str:
+    """Generate the table of content section for a list of headings.
+
+    Args:
+        headers (list): (level, id, html text) of every heading, in order
+        depth (int): deepest heading level to include
+        heading_pages (dict | None): page number of every heading id, printed
+            instead of the page target-counter() finds
+
+    Returns:
+        str: html section holding the table of content
+    """
+    if not headers:
+        return ""
+    # A heading deeper than the previous one opens a nested list, a shallower
+    # one closes the lists of the deeper headings.
+    toc_parts = []
+    open_levels = []
+
+    def close_list():
+        if len(open_levels) <= depth:
+            toc_parts.append("</li></ul>")
+        open_levels.pop()
+
+    for level, heading_id, text in headers:
+        while open_levels and level < open_levels[-1]:
+            close_list()
+        if open_levels and level == open_levels[-1]:
+            if len(open_levels) <= depth:
+                toc_parts.append("</li>")
+        else:
+            open_levels.append(level)
+            if len(open_levels) <= depth:
+                toc_parts.append("<ul>")
+        if len(open_levels) <= depth:
+            page = ""
+            if heading_pages and heading_id in heading_pages:
+                page = f' data-page="{heading_pages[heading_id]}"'
+            toc_parts.append(
+                f'<li><a href="#{heading_id}" class="mdexport-toc-item"{page}>'
+                f"<span>{text}</span></a>"
+            )
+    while open_levels:
+        close_list()
+    updated_toc = "\n".join(toc_parts)
     return f"""
-    {combined_no_page_nr_style}
     <section class="mdexport-toc-container">
         {updated_toc}
 </section>"""
 
 
+@timed("heading pages")
+def get_heading_pages(
+    rendered_document: "weasyprint.Document", heading_ids: List[str]
+) -> dict:
+    """Map the id of every heading in a rendered document to the (1-based)
+    page it starts on.
+
+    The anchors WeasyPrint lists for every page are looked up, instead of
+    walking all the boxes laid out on the pages.
+
+    Args:
+        rendered_document (weasyprint.Document): laid out document
+        heading_ids (List[str]): ids of the headings to look up
+
+    Returns:
+        dict: heading id to page number
+    """
+    heading_ids = set(heading_ids)
+    heading_pages = {}
+    for page_number, page in enumerate(rendered_document.pages, start=1):
+        for anchor in page.anchors:
+            if anchor in heading_ids:
+                heading_pages.setdefault(anchor, page_number)
+    return heading_pages
+
+
+def get_toc_offset(heading_pages: dict) -> int:
+    """Number of pages before the first heading. These pages get no page number
+    and page numbering restarts after them."""
+    if not heading_pages:
+        return 0
+    return min(heading_pages.values()) - 1
+
+
 def generate_no_page_nr_css(offset: int):
     selectors = map(lambda x: f"@page:nth({x})", range(1, offset + 1))
 
@@ -125,37 +356,125 @@ def generate_no_page_nr_css(offset: int):
     )
 
 
-def md_relative_img_to_absolute(md_content: str, md_path: Path) -> str:
-    md_path = md_path.parent
-    image_regex = r"!\[.*?\]\((.*?)\)"
+@lru_cache(maxsize=RESOLVE_CACHE_SIZE)
+def resolve_directory(directory: Path) -> Path:
+    """Absolute path of a directory, resolved once per directory."""
+    return directory.resolve()
 
-    def replace_path(match):
-        img_path = match.group(1)
-        # Skip URLs
-        if re.match(r"https?://", img_path):
-            return match.group(0)
-        # Check if the path is already absolute
-        if Path(img_path).is_absolute():
-            return match.group(0)
-        # Prepend the absolute path to the relative path
-        absolute_path = (md_path / img_path).resolve()
-        return f"![{match.group(0).split('](')[0][2:]}]({absolute_path})"
 
-    # Replace all matches with the updated paths
-    updated_content = re.sub(image_regex, replace_path, md_content)
-    return updated_content
+@lru_cache(maxsize=RESOLVE_CACHE_SIZE)
+def resolve_path(directory: Path, path: str) -> Path:
+    """Absolute path of a file relative to a directory, resolved once per file.
+    Notes in a vault keep embedding the same files."""
+    return (directory / path).resolve()
 
 
 def get_base_path(md_path: Path) -> Path:
-    return md_path.parent.resolve() / ATTACHMENT_DIRECTORY
-
-
-def embed_to_img_tag(markdown: str, base_path) -> str:
-    # Regular expression pattern to match ![[filename]]
-    pattern = r"!\[\[(.*\.(?:jpg|jpeg|png|gif|bmp|tiff|tif|webp|svg|ico|heif|heic|raw|psd|ai|eps|indd|jfif))\]\]"
-
-    def replace_with_img_tag(match):
-        file_name = match.group(1)
-        return f'<img src="{base_path}/{file_name}" alt="{file_name}" />'
-
-    return re.sub(pattern, replace_with_img_tag, markdown)
+    return resolve_directory(md_path.parent) / get_attachment_dir()
+
+
+class Preprocessor:
+    """A rewrite of the markdown text before it is converted to html.
+
+    All preprocessors are combined into one pattern, so a note is scanned once
+    however many there are. Where several match, the first in PREPROCESSORS
+    rewrites the text. Their patterns can not share group names.
+
+    Attributes:
+        pattern (re.Pattern): text to rewrite
+        rewrite (Callable[[re.Match, Path], str]): gets the match of pattern
+            and the path to the markdown file, returns the new text
+    """
+
+    def __init__(self, pattern: str, rewrite: Callable[[re.Match, Path], str]):
+        self.pattern = re.compile(pattern)
+        self.rewrite = rewrite
+
+
+def rewrite_embed(match: re.Match, md_path: Path) -> str:
+    """Turn a ![[filename]] embed into an img tag of the file in the attachments
+    folder."""
+    file_name = match.group(1)
+    return f'<img src="{get_base_path(md_path)}/{file_name}" alt="{file_name}" />'
+
+
+def rewrite_image(match: re.Match, md_path: Path) -> str:
+    """Make the path of a ![alt](path) image absolute, URLs are kept."""
+    alt, img_path = match.group(1), match.group(2)
+    if URL_PATTERN.match(img_path) or Path(img_path).is_absolute():
+        return match.group(0)
+    return f"![{alt}]({resolve_path(md_path.parent, img_path)})"
+
+
+# Rewrites of every note, in order of precedence. Append a Preprocessor to
+# add your own.
+PREPROCESSORS: List[Preprocessor] = [
+    Preprocessor(EMBED_PATTERN, rewrite_embed),
+    Preprocessor(IMAGE_PATTERN, rewrite_image),
+]
+_PREPROCESSOR_GROUP = "mdexport_preprocessor_"
+_combined_preprocessors: tuple = ()
+_combined_pattern = None
+
+
+def get_preprocess_pattern() -> tuple:
+    """The preprocessors and the pattern matching any of them, compiled again
+    when PREPROCESSORS changed."""
+    global _combined_preprocessors, _combined_pattern
+    preprocessors = tuple(PREPROCESSORS)
+    if _combined_pattern is None or preprocessors != _combined_preprocessors:
+        _combined_pattern = re.compile(
+            "|".join(
+                f"(?P<{_PREPROCESSOR_GROUP}{index}>{preprocessor.pattern.pattern})"
+                for index, preprocessor in enumerate(preprocessors)
+            )
+        )
+        _combined_preprocessors = preprocessors
+    return _combined_preprocessors, _combined_pattern
+
+
+@timed("preprocess")
+def preprocess_md(md_content: str, md_path: Path) -> str:
+    """Apply the preprocessors to markdown text in a single scan.
+
+    Args:
+        md_content (str): markdown text without the frontmatter
+        md_path (Path): path to the markdown file
+
+    Returns:
+        str: rewritten markdown text
+    """
+    preprocessors, pattern = get_preprocess_pattern()
+    if not preprocessors:
+        return md_content
+
+    def replace(match):
+        preprocessor = preprocessors[int(match.lastgroup[len(_PREPROCESSOR_GROUP) :])]
+        # The preprocessor gets a match with its own groups.
+        own_match = preprocessor.pattern.match(match.string, match.start())
+        return preprocessor.rewrite(own_match, md_path)
+
+    return pattern.sub(replace, md_content)
+
+
+def get_referenced_files(md_content: str, md_path: Path) -> List[Path]:
+    """List the local files a markdown text embeds.
+
+    Files that do not exist are listed too, a note can embed an image before
+    it is added.
+
+    Args:
+        md_content (str): markdown text without the frontmatter
+        md_path (Path): path to the markdown file
+
+    Returns:
+        List[Path]: embedded files, in order of appearance
+    """
+    attachment_path = get_base_path(md_path)
+    references = []
+    for file_name, _, img_path in REFERENCE_PATTERN.findall(md_content):
+        if file_name:
+            references.append(attachment_path / file_name)
+        elif not URL_PATTERN.match(img_path):
+            references.append(md_path.parent / img_path)
+    return references
@@ -1,30 +1,50 @@
 import click
+import json
+import os
 from pathlib import Path
+from time import perf_counter
 
 from mdexport.cli import (
+    TemplateOption,
     validate_md_file,
     validate_output_file,
-    generate_template_help,
     validate_template,
     validate_output_md,
     validate_toc,
+    validate_workers,
+    pdf_profile_option,
+    check_pdf_profile,
 )
 
-from mdexport.core import generate_renderable_html
-
-from mdexport.markdown import (
-    read_md_file,
-    generate_toc,
+from mdexport.server import (
+    DaemonException,
+    daemon_supported,
+    forward_publish,
+    get_socket_path,
+    serve as serve_daemon,
 )
+from mdexport.config import get_config, CONFIG_HELP, InvalidKeyException
 
-from mdexport.markdown import generate_empty_md
-from mdexport.exporter import write_template_to_pdf
-from mdexport.config import config, CONFIG_HELP
+# The rendering pipeline (weasyprint, markdown2, jinja2) is imported inside
+# the commands that use it. That keeps --help, the options commands, shell
+# completion and publishing through the render daemon fast.
 
 
 @click.group()
-def cli():
-    pass
+@click.option(
+    "--option",
+    "option_overrides",
+    multiple=True,
+    type=(str, str),
+    metavar="KEY VALUE",
+    help="Override an option for this run only, can be repeated.",
+)
+def cli(option_overrides: tuple):
+    for key, value in option_overrides:
+        try:
+            get_config().override(key, value)
+        except InvalidKeyException as e:
+            raise click.BadParameter(f"{e}", param_hint="--option")
 
 
 @click.command()
@@ -34,7 +54,7 @@ def cli():
     "--template",
     "-t",
     required=False,
-    help=generate_template_help(),
+    cls=TemplateOption,
     callback=validate_template,
 )
 @click.option(
@@ -45,18 +65,370 @@ def cli():
     help="Provide a depth between 1 and 6 depending on the depth of subtitles you want to include in the table of content.",
     default=2,
 )
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Do not reuse or store pdf files in the cache of published files.",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    help="Render even when the cache holds a pdf for the same input, and replace it.",
+)
+@click.option(
+    "--no-daemon",
+    is_flag=True,
+    help="Render in this process even when a render daemon (mdexport serve) is running.",
+)
+@click.option(
+    "--timings",
+    is_flag=True,
+    help="Print the time spent in every stage of the publish. Renders in this process.",
+)
+@click.option(
+    "--timings-json",
+    type=click.File("w"),
+    help="Write the time spent in every stage of the publish as json to this file, - for stdout. Renders in this process.",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write a cProfile dump of the publish to this file. Renders in this process.",
+)
+@pdf_profile_option
 def publish(
-    markdown_file: str, output: str, template: str, table_of_content: int
+    markdown_file: str,
+    output: str,
+    template: str,
+    table_of_content: int,
+    no_cache: bool,
+    refresh: bool,
+    no_daemon: bool,
+    timings: bool,
+    timings_json,
+    profile: str | None,
 ) -> None:
     """Publish Markdown files to PDF."""
-    config.pre_publish_config_check()
-    md_path = Path(markdown_file)
-    md_content = read_md_file(md_path)
-    toc_html = generate_toc(
-        generate_renderable_html, md_content, md_path, table_of_content, template
+    get_config().pre_publish_config_check()
+    # Timings and profiles are only taken of a publish in this process.
+    measure = timings or timings_json or profile
+    if not no_daemon and not measure:
+        try:
+            messages = forward_publish(
+                Path(markdown_file),
+                Path(output),
+                template,
+                table_of_content,
+                not no_cache,
+                refresh,
+            )
+        except DaemonException as e:
+            click.echo(f"ERROR: {e}")
+            exit(1)
+        if messages is not None:
+            click.echo(messages, nl=False)
+            return
+    # The daemon reports an unknown profile itself, checking it here would
+    # parse the template in this process.
+    check_pdf_profile(template)
+    if profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = perf_counter()
+    from mdexport.core import publish_md_file
+
+    cached = publish_md_file(
+        Path(markdown_file),
+        Path(output),
+        template,
+        table_of_content,
+        not no_cache,
+        refresh,
+    )
+    total = perf_counter() - start
+    if profile:
+        profiler.disable()
+        profiler.dump_stats(profile)
+    if cached:
+        click.echo(f"{output} is unchanged, reused it from the cache.")
+    else:
+        from mdexport.profiles import format_pdf_report
+        from mdexport.timings import get_timings
+
+        pdf_seconds = get_timings().get("pdf", {"seconds": 0})["seconds"]
+        click.echo(format_pdf_report(Path(output), template, pdf_seconds))
+    if timings or timings_json:
+        from mdexport.timings import format_timings, get_timings
+
+        if timings:
+            click.echo(format_timings(get_timings(), total))
+        if timings_json:
+            json.dump(
+                {"total": total, "stages": get_timings()}, timings_json, indent=2
+            )
+            timings_json.write("\n")
+
+
+@click.command()
+@click.argument("markdown_file", type=str, callback=validate_md_file)
+@click.option("--output", "-o", required=True, type=str, callback=validate_output_file)
+@click.option(
+    "--template",
+    "-t",
+    required=False,
+    cls=TemplateOption,
+    callback=validate_template,
+)
+@click.option(
+    "--table-of-content",
+    "-toc",
+    type=int,
+    callback=validate_toc,
+    help="Provide a depth between 1 and 6 depending on the depth of subtitles you want to include in the table of content.",
+    default=2,
+)
+@pdf_profile_option
+def watch(markdown_file: str, output: str, template: str, table_of_content: int):
+    """Publish a Markdown file to PDF again whenever it, its images or its template change."""
+    get_config().pre_publish_config_check()
+    check_pdf_profile(template)
+    from mdexport.watch import NoteWatcher
+
+    click.echo(f"Watching {markdown_file}. Press Ctrl+C to stop.")
+    watcher = NoteWatcher(Path(markdown_file), Path(output), template, table_of_content)
+    try:
+        watcher.run(click.echo)
+    except KeyboardInterrupt:
+        pass
+
+
+@click.command()
+def serve():
+    """Run a render daemon that keeps templates and fonts loaded for publish."""
+    if not daemon_supported():
+        click.echo("ERROR: The render daemon needs Unix sockets, which are not available on this platform.")
+        exit(1)
+    get_config().pre_publish_config_check()
+    socket_path = get_socket_path()
+    click.echo(f"Render daemon listening on {socket_path}. Press Ctrl+C to stop.")
+    try:
+        serve_daemon(socket_path)
+    except DaemonException as e:
+        click.echo(f"ERROR: {e}")
+        exit(1)
+
+
+@click.command()
+@click.argument("inputs", nargs=-1, required=True, type=str)
+@click.option(
+    "--output-dir",
+    "-o",
+    required=True,
+    type=click.Path(file_okay=False, path_type=Path),
+    help="Directory the pdf files are written to.",
+)
+@click.option(
+    "--template",
+    "-t",
+    required=False,
+    cls=TemplateOption,
+    callback=validate_template,
+)
+@click.option(
+    "--table-of-content",
+    "-toc",
+    type=int,
+    callback=validate_toc,
+    help="Provide a depth between 1 and 6 depending on the depth of subtitles you want to include in the table of content.",
+    default=2,
+)
+@click.option(
+    "--workers",
+    "-w",
+    type=int,
+    callback=validate_workers,
+    default=os.cpu_count() or 1,
+    help="Number of worker processes. Defaults to the number of CPUs.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Do not reuse or store pdf files in the cache of published files.",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    help="Render even when the cache holds a pdf for the same input, and replace it.",
+)
+@pdf_profile_option
+def batch(
+    inputs: tuple[str, ...],
+    output_dir: Path,
+    template: str,
+    table_of_content: int,
+    workers: int,
+    no_cache: bool,
+    refresh: bool,
+) -> None:
+    """Publish many Markdown files (files, directories or glob patterns) to PDF."""
+    get_config().pre_publish_config_check()
+    check_pdf_profile(template)
+    from mdexport.batch import (
+        DuplicateOutputException,
+        collect_md_files,
+        publish_batch,
+    )
+
+    try:
+        jobs = collect_md_files(inputs, output_dir)
+    except DuplicateOutputException as e:
+        click.echo(f"ERROR: {e}")
+        exit(1)
+    if not jobs:
+        click.echo("No markdown files found.")
+        return
+    start = perf_counter()
+    failed = 0
+    cached = 0
+    for result in publish_batch(
+        jobs, template, table_of_content, workers, not no_cache, refresh
+    ):
+        if result.succeeded:
+            cached += result.cached
+            source = "cache" if result.cached else f"{result.seconds:.2f}s"
+            click.echo(
+                f"{result.md_path} -> {result.output} "
+                f"({source}, {result.size / 1024:.1f} KB)"
+            )
+        else:
+            failed += 1
+            click.echo(f"FAILED {result.md_path}: {result.error}", err=True)
+    elapsed = perf_counter() - start
+    click.echo(
+        f"Published {len(jobs) - failed} of {len(jobs)} files in {elapsed:.2f}s "
+        f"({len(jobs) / elapsed:.2f} files/s, {workers} workers), "
+        f"{cached} from the cache, {failed} failed."
+    )
+
+
+@click.command()
+@click.argument("vault", type=click.Path(exists=True, file_okay=False, path_type=Path))
+@click.option(
+    "--output-dir",
+    "-o",
+    required=True,
+    type=click.Path(file_okay=False, path_type=Path),
+    help="Directory the pdf files are written to.",
+)
+@click.option(
+    "--template",
+    "-t",
+    required=False,
+    cls=TemplateOption,
+    callback=validate_template,
+)
+@click.option(
+    "--table-of-content",
+    "-toc",
+    type=int,
+    callback=validate_toc,
+    help="Provide a depth between 1 and 6 depending on the depth of subtitles you want to include in the table of content.",
+    default=2,
+)
+@click.option(
+    "--workers",
+    "-w",
+    type=int,
+    callback=validate_workers,
+    default=os.cpu_count() or 1,
+    help="Number of worker processes. Defaults to the number of CPUs.",
+)
+@click.option("--force", is_flag=True, help="Publish every note, changed or not.")
+@pdf_profile_option
+def build(
+    vault: Path,
+    output_dir: Path,
+    template: str,
+    table_of_content: int,
+    workers: int,
+    force: bool,
+) -> None:
+    """Publish the notes of a vault that changed since the last build, and
+    remove the pdf files of deleted notes."""
+    get_config().pre_publish_config_check()
+    check_pdf_profile(template)
+    from mdexport.build import plan_build, run_build
+
+    start = perf_counter()
+    plan = plan_build(vault, output_dir, template, table_of_content, force)
+    failed = 0
+    for result in run_build(plan, output_dir, template, table_of_content, workers):
+        if result.succeeded:
+            click.echo(
+                f"{result.md_path} -> {result.output} "
+                f"({result.seconds:.2f}s, {result.size / 1024:.1f} KB)"
+            )
+        else:
+            failed += 1
+            click.echo(f"FAILED {result.md_path}: {result.error}", err=True)
+    click.echo(
+        f"Published {len(plan.dirty) - failed} of {len(plan.dirty)} changed notes "
+        f"in {perf_counter() - start:.2f}s, {len(plan.unchanged)} unchanged, "
+        f"{len(plan.orphans)} removed, {failed} failed."
+    )
+
+
+@click.command()
+@click.argument("inputs", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--output", "-o", required=True, type=str, callback=validate_output_file)
+@click.option(
+    "--template",
+    "-t",
+    required=False,
+    cls=TemplateOption,
+    callback=validate_template,
+)
+@click.option(
+    "--table-of-content",
+    "-toc",
+    type=int,
+    callback=validate_toc,
+    help="Provide a depth between 1 and 6 depending on the depth of subtitles you want to include in the table of content.",
+    default=2,
+)
+@click.option(
+    "--workers",
+    "-w",
+    type=int,
+    callback=validate_workers,
+    default=os.cpu_count() or 1,
+    help="Number of worker processes parsing the chapters. Defaults to the number of CPUs.",
+)
+@pdf_profile_option
+def book(
+    inputs: tuple[str, ...],
+    output: str,
+    template: str,
+    table_of_content: int,
+    workers: int,
+) -> None:
+    """Publish Markdown files (files or directories, in order) as the chapters of one PDF."""
+    get_config().pre_publish_config_check()
+    check_pdf_profile(template)
+    from mdexport.book import collect_chapters, publish_book
+
+    md_paths = collect_chapters(inputs)
+    if not md_paths:
+        click.echo("No markdown files found.")
+        return
+    start = perf_counter()
+    pages = publish_book(md_paths, Path(output), template, table_of_content, workers)
+    click.echo(
+        f"Published {len(md_paths)} chapters, {pages} pages, to {output} "
+        f"in {perf_counter() - start:.2f}s."
     )
-    filled_template = generate_renderable_html(md_content, md_path, template, toc_html)
-    write_template_to_pdf(template, filled_template, Path(output))
 
 
 @click.command()
@@ -69,12 +441,14 @@ def publish(
 @click.option(
     "--template",
     "-t",
-    help=generate_template_help(),
+    cls=TemplateOption,
     required=True,
     callback=validate_template,
 )
 def empty_markdown(output_file: Path, template: str):
     """Create empty markdown files with the metadata fields in template."""
+    from mdexport.markdown import generate_empty_md
+
     generate_empty_md(output_file, template)
 
 
@@ -88,7 +462,7 @@ def options():
 def list():
     """List all available options."""
     click.echo("Available options:")
-    for key, value in config.config.items():
+    for key, value in get_config().config.items():
         click.echo("")
         click.echo(f"   {key}: {value}")
         click.echo("")
@@ -100,14 +474,18 @@ def list():
 @click.argument("value")
 def set(key: str, value: str):
     """Set an option value."""
-    config.set(key, value)
-    config.save()
+    get_config().set(key, value)
     click.echo(f"Succesfully set {key}: {value}")
 
 
 cli.add_command(options)
 cli.add_command(empty_markdown, "emptymd")
 cli.add_command(publish)
+cli.add_command(batch)
+cli.add_command(book)
+cli.add_command(build)
+cli.add_command(serve)
+cli.add_command(watch)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+from pathlib import Path
+import re
+
+from mdexport.config import ConfigStructure, get_config
+
+# WeasyPrint options of every output profile, applied when laying out (images)
+# and when writing the pdf (fonts and compression).
+PDF_PROFILES = {
+    # WeasyPrint defaults: images as they are, subsetted fonts.
+    "default": {},
+    # Small files to email and read on screen.
+    "screen": {"optimize_images": True, "jpeg_quality": 60, "dpi": 150},
+    # Images sharp enough to print.
+    "print": {"optimize_images": True, "jpeg_quality": 90, "dpi": 300},
+    # PDF/A with complete fonts and untouched images, to keep for years.
+    "archive": {"pdf_variant": "pdf/a-3b", "full_fonts": True, "hinting": True},
+    # Fastest to write, for previews: nothing is compressed.
+    "draft": {"uncompressed_pdf": True},
+}
+# A template picks its profile with <meta name="mdexport-pdf-profile" content="screen">
+TEMPLATE_PROFILE_PATTERN = re.compile(
+    r'<meta\s+name="mdexport-pdf-profile"\s+content="([^"]*)"', re.IGNORECASE
+)
+
+
+class UnknownPdfProfileException(Exception):
+    pass
+
+
+def get_pdf_profile(template: str | None) -> str:
+    """Name of the output profile to publish with.
+
+    A profile given for this run, on the command line or in the environment,
+    comes first. Then the profile the template, or a template it extends,
+    asks for, then the pdf_profile option.
+
+    Args:
+        template (str | None): template name
+
+    Returns:
+        str: profile name
+    """
+    config = get_config()
+    if ConfigStructure.PDF_PROFILE in config.overrides:
+        return config.overrides[ConfigStructure.PDF_PROFILE]
+    if template:
+        # Imported here, the templates module imports this one. The registry
+        # only reads the template again when it changed.
+        from mdexport.templates import get_registry
+
+        template_profile = get_registry().pdf_profile(template)
+        if template_profile:
+            return template_profile
+    return config.config[ConfigStructure.PDF_PROFILE]
+
+
+def get_pdf_options(template: str | None) -> dict:
+    """WeasyPrint options of the output profile to publish with.
+
+    Args:
+        template (str | None): template name
+
+    Raises:
+        UnknownPdfProfileException: the profile does not exist
+
+    Returns:
+        dict: options for rendering and writing the pdf
+    """
+    profile = get_pdf_profile(template)
+    if profile not in PDF_PROFILES:
+        raise UnknownPdfProfileException(
+            f"Unknown pdf profile {profile}, use one of: {', '.join(PDF_PROFILES)}"
+        )
+    return PDF_PROFILES[profile]
+
+
+def format_pdf_report(output: Path, template: str | None, seconds: float) -> str:
+    """One line with the size, the profile and the write time of a pdf."""
+    size = output.stat().st_size / 1024
+    return (
+        f"Wrote {output}: {size:.1f} KB with the {get_pdf_profile(template)} "
+        f"profile, the pdf took {seconds:.2f}s"
+    )
@@ -0,0 +1,210 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+import json
+import os
+import socket
+import socketserver
+import tempfile
+
+import click
+
+from mdexport.config import APP_NAME, get_config, use_config
+
+SOCKET_FILENAME = f"{APP_NAME}.sock"
+# Seconds a client waits for the daemon to finish a publish job.
+CLIENT_TIMEOUT = 600
+DAEMON_HINT = "Publish with --no-daemon, or restart the daemon with mdexport serve."
+
+
+class DaemonException(Exception):
+    pass
+
+
+def get_socket_path() -> Path:
+    """Path of the Unix socket the render daemon listens on.
+
+    Returns:
+        Path: socket path in the user runtime directory, or in the temp directory
+        when there is none
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / SOCKET_FILENAME
+    return Path(tempfile.gettempdir()) / f"{APP_NAME}-{os.getuid()}.sock"
+
+
+def daemon_supported() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+class PublishRequestHandler(socketserver.StreamRequestHandler):
+    """Handle one publish job: a json line in, a json line out.
+
+    Every job is published with the options of the client that sent it, so
+    options set or overridden after the daemon started are used.
+    """
+
+    def handle(self):
+        # Imported here so the client side of this module stays light.
+        from mdexport.core import publish_md_file
+        from mdexport.profiles import format_pdf_report
+        from mdexport.timings import get_timings, reset_timings
+
+        job = json.loads(self.rfile.readline())
+        messages = StringIO()
+        reset_timings()
+        use_config(job["config"]["stored"], job["config"]["overrides"])
+        try:
+            with redirect_stdout(messages):
+                if publish_md_file(
+                    Path(job["markdown_file"]),
+                    Path(job["output"]),
+                    job["template"],
+                    job["table_of_content"],
+                    job["use_cache"],
+                    job["refresh"],
+                ):
+                    click.echo(f"{job['output']} is unchanged, reused it from the cache.")
+                else:
+                    pdf_seconds = get_timings().get("pdf", {"seconds": 0})["seconds"]
+                    click.echo(
+                        format_pdf_report(
+                            Path(job["output"]), job["template"], pdf_seconds
+                        )
+                    )
+            response = {"ok": True, "messages": messages.getvalue()}
+        except Exception as e:
+            response = {"ok": False, "messages": messages.getvalue(), "error": f"{e}"}
+        except SystemExit:
+            # The pipeline printed why it stopped, the daemon keeps serving.
+            response = {
+                "ok": False,
+                "messages": messages.getvalue(),
+                "error": "The render daemon could not publish the file.",
+            }
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+def warm_up() -> None:
+    """Load everything a publish job needs that outlives a single job."""
+    from mdexport.exporter import get_base_stylesheet
+    from mdexport.templates import get_available_templates, load_template
+
+    get_base_stylesheet()
+    for template in get_available_templates():
+        load_template(template)
+
+
+def serve(socket_path: Path) -> None:
+    """Run the render daemon until interrupted.
+
+    Args:
+        socket_path (Path): Unix socket to listen on
+    """
+    if socket_path.exists():
+        if _daemon_is_running(socket_path):
+            raise DaemonException(f"A daemon is already running on {socket_path}")
+        # Left behind by a daemon that did not shut down cleanly.
+        socket_path.unlink()
+    warm_up()
+    with socketserver.UnixStreamServer(
+        str(socket_path), PublishRequestHandler
+    ) as server:
+        os.chmod(socket_path, 0o600)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            socket_path.unlink(missing_ok=True)
+
+
+def _daemon_is_running(socket_path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def forward_publish(
+    markdown_file: Path,
+    output: Path,
+    template: str | None,
+    table_of_content: int,
+    use_cache: bool = False,
+    refresh: bool = False,
+) -> str | None:
+    """Hand a publish job to a running render daemon.
+
+    Args:
+        markdown_file (Path): path to the markdown file
+        output (Path): path of the pdf file
+        template (str | None): template name
+        table_of_content (int): deepest heading level in the table of content
+        use_cache (bool): reuse and store pdf files in the output cache
+        refresh (bool): render even when the cache has the pdf, and replace it
+
+    The job carries the options of this process, the daemon publishes with
+    those instead of the ones it started with.
+
+    Raises:
+        DaemonException: the daemon failed to publish the file, or stopped
+            answering, or the socket belongs to another user
+
+    Returns:
+        str | None: output printed by the daemon while publishing, None when no
+        daemon is running and the file has to be published in process
+    """
+    if not daemon_supported():
+        return None
+    socket_path = get_socket_path()
+    try:
+        socket_owner = socket_path.lstat().st_uid
+    except OSError:
+        return None
+    # Without a runtime directory the socket is in the shared temp directory,
+    # where another user could create it first and receive every job.
+    if socket_owner != os.getuid():
+        raise DaemonException(
+            f"{socket_path} belongs to another user, it is not your render "
+            "daemon. Publish with --no-daemon, or remove it and start the "
+            "daemon with mdexport serve."
+        )
+    config = get_config()
+    job = {
+        "markdown_file": str(markdown_file.resolve()),
+        "output": str(output.resolve()),
+        "template": template,
+        "table_of_content": table_of_content,
+        "use_cache": use_cache,
+        "refresh": refresh,
+        "config": {"stored": config.stored, "overrides": config.overrides},
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(str(socket_path))
+        except OSError:
+            return None
+        client.settimeout(CLIENT_TIMEOUT)
+        try:
+            client.sendall(json.dumps(job).encode() + b"\n")
+            with client.makefile("rb") as response_file:
+                response_line = response_file.readline()
+        except OSError as e:
+            raise DaemonException(
+                f"The render daemon did not answer: {e}. {DAEMON_HINT}"
+            )
+    try:
+        response = json.loads(response_line)
+    except ValueError:
+        # The daemon stopped in the middle of the job.
+        raise DaemonException(
+            f"The render daemon stopped while publishing {markdown_file}. "
+            f"{DAEMON_HINT}"
+        )
+    if not response["ok"]:
+        raise DaemonException(response["messages"] + response["error"])
+    return response["messages"]
@@ -1,14 +1,23 @@
-from typing import List, Set
+from pathlib import Path
+from typing import Dict, List, Set, Tuple, TYPE_CHECKING
+import json
 
-from jinja2 import meta
-import jinja2
 import click
 
 from mdexport.config import (
     get_templates_directory,
+    get_cache_directory,
+    template_cache_enabled,
     TemplateDirNotSetException,
     APP_NAME,
 )
+from mdexport.profiles import TEMPLATE_PROFILE_PATTERN
+from mdexport.timings import timed
+
+# Jinja2 is imported where templates are parsed or rendered, so listing the
+# templates to validate a template name stays fast.
+if TYPE_CHECKING:
+    import jinja2
 
 
 class ExpectedMoreMetaDataException(Exception):
@@ -18,55 +27,321 @@ class ExpectedMoreMetaDataException(Exception):
 BODY_VAR = "body"
 TOC_VAR = "toc"
 SPECIAL_VARS = [BODY_VAR, TOC_VAR]
+TEMPLATE_FILENAME = "template.html"
+REGISTRY_FILENAME = "templates.json"
+# Bump when the stored registry changes, older ones are listed again.
+REGISTRY_VERSION = 5
+
+
+class TemplateRegistry:
+    """Templates of a template directory and the variables each one uses.
+
+    The directory is only listed again when its modification time changes,
+    which happens when a template folder is added, removed or renamed, or when
+    asked to. Every template file is only parsed again when it changes, for the
+    variables it uses, the template files it extends, includes or imports and
+    the pdf profile it asks for. With a persist path, the registry is also kept
+    on disk so a new process does not list a large template share again.
+    """
+
+    def __init__(self, directory: Path, persist_path: Path | None = None):
+        self.directory = directory
+        self.persist_path = persist_path
+        self._mtime: int | None = None
+        self._templates: List[str] = []
+        # Template file, relative to the directory, to (modification time,
+        # variables, referenced template files, pdf profile) of that file. A
+        # referenced file is None when its name is only known when rendering.
+        self._files: Dict[str, Tuple[int, frozenset, tuple, str | None]] = {}
+        self._load()
+
+    def templates(self, refresh: bool = False) -> List[str]:
+        """Names of the folders holding a template.html, sorted.
+
+        Args:
+            refresh (bool): list the directory again even when its modification
+                time did not change. A template.html added to or removed from
+                an existing folder only changes that folder.
+
+        Returns:
+            List[str]: template names
+        """
+        try:
+            mtime = self.directory.stat().st_mtime_ns
+        except OSError:
+            return []
+        if refresh or mtime != self._mtime:
+            self._templates = sorted(
+                f.name
+                for f in self.directory.iterdir()
+                if f.is_dir() and (f / TEMPLATE_FILENAME).is_file()
+            )
+            self._mtime = mtime
+            self._save()
+        return list(self._templates)
+
+    def template_files(self, template: str) -> List[str] | None:
+        """The template.html of a template and every template file it extends,
+        includes or imports, directly or through another one.
+
+        Args:
+            template (str): template name
+
+        Returns:
+            List[str] | None: template files relative to the directory, the
+            template.html first. None when a name is only known when rendering.
+        """
+        names, dynamic = self._walk(template)
+        return None if dynamic else names
+
+    def variables(self, template: str) -> Set[str]:
+        """All variables used in the template.html of a template and in the
+        template files it extends, includes or imports."""
+        names, _ = self._walk(template)
+        return {variable for name in names for variable in self._files[name][1]}
+
+    def pdf_profile(self, template: str) -> str | None:
+        """The pdf profile a template asks for with its mdexport-pdf-profile meta
+        tag, or a template file it extends or includes does. None without one."""
+        names, _ = self._walk(template)
+        for name in names:
+            if self._files[name][3] is not None:
+                return self._files[name][3]
+        return None
+
+    def _walk(self, template: str) -> Tuple[List[str], bool]:
+        from jinja2 import TemplateNotFound
+        from jinja2.loaders import split_template_path
+
+        root = f"{template}/{TEMPLATE_FILENAME}"
+        pending = [root]
+        seen = {root}
+        names = []
+        dynamic = False
+        changed = False
+        while pending:
+            name = pending.pop(0)
+            try:
+                entry, parsed = self._parse(name)
+            except OSError:
+                if name == root:
+                    raise
+                # Jinja2 reports a missing template when rendering.
+                continue
+            names.append(name)
+            changed = changed or parsed
+            for reference in entry[2]:
+                if reference is None:
+                    dynamic = True
+                    continue
+                try:
+                    # The name as the loader of the environment finds it.
+                    reference = "/".join(split_template_path(reference))
+                except TemplateNotFound:
+                    continue
+                if reference not in seen:
+                    seen.add(reference)
+                    pending.append(reference)
+        if changed:
+            self._save()
+        return names, dynamic
+
+    def _parse(self, name: str) -> Tuple[tuple, bool]:
+        mtime = (self.directory / name).stat().st_mtime_ns
+        entry = self._files.get(name)
+        if entry is not None and entry[0] == mtime:
+            return entry, False
+        source = (self.directory / name).read_text()
+        variables, references = analyze_template(source)
+        profile_match = TEMPLATE_PROFILE_PATTERN.search(source)
+        entry = (
+            mtime,
+            frozenset(variables),
+            tuple(references),
+            profile_match.group(1) if profile_match else None,
+        )
+        self._files[name] = entry
+        return entry, True
+
+    def _load(self) -> None:
+        if self.persist_path is None:
+            return
+        try:
+            stored = json.loads(self.persist_path.read_text())
+        except (OSError, ValueError):
+            return
+        if (
+            stored.get("version") != REGISTRY_VERSION
+            or stored.get("directory") != str(self.directory)
+        ):
+            return
+        self._mtime = stored["mtime"]
+        self._templates = stored["templates"]
+        self._files = {
+            name: (mtime, frozenset(variables), tuple(references), profile)
+            for name, (mtime, variables, references, profile) in stored[
+                "files"
+            ].items()
+        }
 
+    def _save(self) -> None:
+        if self.persist_path is None:
+            return
+        # Imported here, the cache module imports this one through markdown.
+        from mdexport.cache import write_atomic
 
-def get_available_templates() -> List[str]:
+        stored = {
+            "version": REGISTRY_VERSION,
+            "directory": str(self.directory),
+            "mtime": self._mtime,
+            "templates": self._templates,
+            "files": {
+                name: [mtime, sorted(variables), list(references), profile]
+                for name, (mtime, variables, references, profile) in self._files.items()
+            },
+        }
+        try:
+            write_atomic(self.persist_path, json.dumps(stored).encode())
+        except OSError:
+            # A registry that can not be stored is listed again next time.
+            pass
+
+
+_registry = None
+
+
+def get_registry() -> TemplateRegistry:
+    """Template registry of the template directory, shared by this process.
+
+    With the template_cache option on, it is stored in the cache directory.
+    """
+    global _registry
+    templates_directory = get_templates_directory()
+    if _registry is None or _registry.directory != templates_directory:
+        persist_path = None
+        if template_cache_enabled():
+            persist_path = get_cache_directory() / REGISTRY_FILENAME
+        _registry = TemplateRegistry(templates_directory, persist_path)
+    return _registry
+
+
+def get_available_templates(refresh: bool = False) -> List[str]:
     """List all the directories in the templates directory
 
+    Args:
+        refresh (bool): list the templates directory again, see
+            TemplateRegistry.templates
+
     Returns:
         [str]: Available templates
     """
     try:
-        templates_directory = get_templates_directory()
-
-        # return an empty list if the directory does not exist.
-        if not templates_directory.is_dir():
-            return []
-        return [
-            str(f.name)
-            for f in templates_directory.iterdir()
-            if f.is_dir() and (f / "template.html").is_file()
-        ]
+        return get_registry().templates(refresh)
     except TemplateDirNotSetException:
         return []
 
 
+def get_template_files(template: str) -> List[Path]:
+    """List the files a template is rendered from: the files in its folder and
+    the template files it extends, includes or imports from other folders.
+    Hidden files are excluded.
+
+    When the template computes a template name while rendering, that can be any
+    file, so every file in the template directory is listed.
+
+    Args:
+        template (str): template name
+
+    Returns:
+        List[Path]: files, those of the folder sorted by path first
+    """
+    templates_directory = get_templates_directory()
+    referenced = get_registry().template_files(template)
+    folder = templates_directory / (template if referenced is not None else "")
+    files = [
+        path
+        for path in sorted(folder.rglob("*"))
+        if path.is_file() and not path.name.startswith(".")
+    ]
+    for name in referenced or []:
+        path = templates_directory / name
+        if path not in files:
+            files.append(path)
+    return files
+
+
 def read_template(template: str):
     try:
-        current_template = get_templates_directory() / template / "template.html"
+        current_template = get_templates_directory() / template / TEMPLATE_FILENAME
         return current_template.read_text()
     except TemplateDirNotSetException:
-        click.echo(
-            f"""ERROR: Template directory not set in mdexport config.
+        _exit_template_dir_not_set()
+
+
+def _exit_template_dir_not_set():
+    click.echo(
+        f"""ERROR: Template directory not set in mdexport config.
 Please run:
 {APP_NAME} settemplatedir /path/to/templates/
 Your template directory should hold only folders named with the template name.
 Inside the should be a Jinja2 template named "template.html"  
             """
+    )
+    exit()
+
+
+_environment = None
+_environment_directory = None
+
+
+def get_environment() -> "jinja2.Environment":
+    """Jinja2 environment shared by every render in this process.
+
+    The loader is rooted at the template directory, so templates can include or
+    extend each other by "template name/file name". Compiled templates are
+    cached and recompiled when their file changes. With the template_cache
+    option on, compiled templates are also kept on disk for new processes.
+    The environment is rebuilt when the template directory changes.
+
+    Returns:
+        jinja2.Environment: the shared environment
+    """
+    import jinja2
+
+    global _environment, _environment_directory
+    try:
+        templates_directory = get_templates_directory()
+    except TemplateDirNotSetException:
+        _exit_template_dir_not_set()
+    if _environment is None or _environment_directory != templates_directory:
+        bytecode_cache = None
+        if template_cache_enabled():
+            bytecode_cache = jinja2.FileSystemBytecodeCache(
+                str(get_cache_directory())
+            )
+        _environment = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(templates_directory),
+            bytecode_cache=bytecode_cache,
+            auto_reload=True,
         )
-        exit()
+        _environment_directory = templates_directory
+    return _environment
+
 
+def load_template(template: str) -> "jinja2.Template":
+    """Get the compiled template.html of a template."""
+    return get_environment().get_template(f"{template}/{TEMPLATE_FILENAME}")
 
+
+@timed("template")
 def fill_template(template: str, html_content: str, metadata: dict = {}) -> str:
-    # TODO: decouple read_template
-    template_html = jinja2.Template(read_template(template))
+    template_html = load_template(template)
     return template_html.render(body=html_content, **metadata)
 
 
 def match_metadata_to_template(template: str, metadata_keys: List[str]):
     # TODO: rename function to something more describing the action
-    template_html = read_template(template)
-    template_variables = extract_variables(template_html)
+    template_variables = get_template_variables(template)
     not_included_metadata = list(
         set(template_variables) - set(metadata_keys) - set(SPECIAL_VARS)
     )
@@ -86,14 +361,52 @@ def extract_variables(template_string: str) -> Set[str]:
     Returns:
         List[str]: variable names
     """
+    return analyze_template(template_string)[0]
+
+
+def analyze_template(template_string: str) -> Tuple[Set[str], List[str | None]]:
+    """Variables used in a jinja2 template and the templates it extends,
+    includes or imports.
+
+    Args:
+        template_string (str): jinja2 html template string
+
+    Returns:
+        Tuple[Set[str], List[str | None]]: variable names and referenced
+        template names, None for a name that is only known when rendering
+    """
+    import jinja2
+    from jinja2 import meta
+
     env = jinja2.Environment()
     parsed_content = env.parse(template_string)
     variables = meta.find_undeclared_variables(parsed_content)
-    return set(variables)
+    return set(variables), list(meta.find_referenced_templates(parsed_content))
+
+
+def get_template_variables(template: str) -> Set[str]:
+    """All variables used in the template.html of a template and the template
+    files it extends, includes or imports. They are only extracted again when
+    a file changed.
+
+    Args:
+        template (str): template name
+
+    Returns:
+        Set[str]: variable names
+    """
+    try:
+        return get_registry().variables(template)
+    except TemplateDirNotSetException:
+        _exit_template_dir_not_set()
 
 
 def get_variables_from_template(template: str):
-    template_html = read_template(template)
     return list(
-        filter(lambda var: var not in SPECIAL_VARS, extract_variables(template_html))
+        filter(lambda var: var not in SPECIAL_VARS, get_template_variables(template))
     )
+
+
+def template_uses_toc(template: str) -> bool:
+    """Check if a template places the table of content."""
+    return TOC_VAR in get_template_variables(template)
@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Dict, Iterator
+
+# Wall time in seconds and number of calls of every pipeline stage, in the
+# order the stages first ran.
+_stages: Dict[str, list] = {}
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Add the wall time of the block to a pipeline stage.
+
+    Args:
+        name (str): name of the stage
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        seconds = perf_counter() - start
+        totals = _stages.setdefault(name, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+
+def timed(name: str) -> Callable:
+    """Decorator adding the wall time of every call to a pipeline stage.
+
+    Args:
+        name (str): name of the stage
+    """
+
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def reset_timings() -> None:
+    _stages.clear()
+
+
+def get_timings() -> Dict[str, dict]:
+    """Wall time and call count of every stage that ran.
+
+    Returns:
+        Dict[str, dict]: stage name to its "seconds" and "calls"
+    """
+    return {
+        name: {"seconds": seconds, "calls": calls}
+        for name, (seconds, calls) in _stages.items()
+    }
+
+
+def format_timings(timings: Dict[str, dict], total: float) -> str:
+    """Human readable table of the stage timings.
+
+    Stages can run inside other stages, so they do not add up to the total.
+
+    Args:
+        timings (Dict[str, dict]): stage timings, as returned by get_timings
+        total (float): wall time of the whole run in seconds
+
+    Returns:
+        str: one line per stage
+    """
+    width = max([len(name) for name in timings] + [len("total")])
+    lines = [
+        f"{name:<{width}}  {timing['seconds']:8.3f}s  {timing['calls']:>4}x"
+        for name, timing in timings.items()
+    ]
+    lines.append(f"{'total':<{width}}  {total:8.3f}s")
+    return "\n".join(lines)
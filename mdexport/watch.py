@@ -0,0 +1,131 @@
+from pathlib import Path
+from time import perf_counter, sleep
+from typing import Callable, Dict, List
+
+from mdexport.config import get_templates_directory
+from mdexport.core import render_document
+from mdexport.exporter import write_document_to_pdf
+from mdexport.markdown import MarkdownDocument, get_referenced_files, parse_md_file
+from mdexport.templates import get_template_files
+
+# Seconds between two checks of the watched files.
+POLL_INTERVAL = 0.2
+# Seconds the watched files have to stay unchanged before rebuilding.
+DEBOUNCE_DELAY = 0.3
+
+NOTE = "note"
+ATTACHMENTS = "attachments"
+TEMPLATE = "template"
+
+
+def snapshot(paths: List[Path]) -> Dict[Path, tuple | None]:
+    """Modification time and size of every path, None for missing paths."""
+    state = {}
+    for path in paths:
+        try:
+            stat = path.stat()
+            state[path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            state[path] = None
+    return state
+
+
+class NoteWatcher:
+    """Keeps a published pdf up to date with its note, attachments and template.
+
+    The parsed note, the compiled template and the fonts stay loaded between
+    rebuilds. The note is only parsed again when it changed and the offset of
+    the table of content of the previous rebuild is reused as first guess.
+    """
+
+    def __init__(
+        self, md_path: Path, output: Path, template: str | None, toc_depth: int
+    ):
+        self.md_path = md_path
+        self.output = output
+        self.template = template
+        self.toc_depth = toc_depth
+        self.md_document: MarkdownDocument | None = None
+        self.offset = 0
+
+    def watched_files(self) -> Dict[str, List[Path]]:
+        """Files the pdf depends on, per kind of dependency.
+
+        Attachments that do not exist yet are watched too, the pdf is rebuilt
+        when they are added.
+        """
+        watched = {NOTE: [self.md_path], ATTACHMENTS: [], TEMPLATE: []}
+        if self.md_document:
+            watched[ATTACHMENTS] = get_referenced_files(
+                self.md_document.content, self.md_path
+            )
+        if self.template:
+            # The folder itself changes when files are added or removed.
+            watched[TEMPLATE] = [
+                get_templates_directory() / self.template
+            ] + get_template_files(self.template)
+        return watched
+
+    def rebuild(self, note_changed: bool) -> float:
+        """Render the pdf again.
+
+        Args:
+            note_changed (bool): parse the note again
+
+        Returns:
+            float: seconds the rebuild took
+        """
+        start = perf_counter()
+        if note_changed or self.md_document is None:
+            self.md_document = parse_md_file(self.md_path)
+        rendered_document, self.offset = render_document(
+            self.md_document, self.template, self.toc_depth, self.offset
+        )
+        write_document_to_pdf(rendered_document, self.output, self.template)
+        return perf_counter() - start
+
+    def run(self, report: Callable[[str], None]) -> None:
+        """Rebuild on every change until interrupted.
+
+        Args:
+            report (Callable[[str], None]): receives a message after every rebuild
+        """
+        self._rebuild_and_report(True, "first build", report)
+        watched = self.watched_files()
+        state = snapshot(_all_files(watched))
+        while True:
+            sleep(POLL_INTERVAL)
+            new_state = snapshot(_all_files(watched))
+            if new_state == state:
+                continue
+            # Wait until the files stop changing, editors often save in steps.
+            while True:
+                sleep(DEBOUNCE_DELAY)
+                settled_state = snapshot(_all_files(watched))
+                if settled_state == new_state:
+                    break
+                new_state = settled_state
+            changed = [
+                kind
+                for kind, paths in watched.items()
+                if any(state.get(path) != new_state.get(path) for path in paths)
+            ]
+            self._rebuild_and_report(
+                NOTE in changed, f"{', '.join(changed)} changed", report
+            )
+            watched = self.watched_files()
+            state = snapshot(_all_files(watched))
+
+    def _rebuild_and_report(
+        self, note_changed: bool, reason: str, report: Callable[[str], None]
+    ) -> None:
+        try:
+            seconds = self.rebuild(note_changed)
+        except Exception as e:
+            report(f"ERROR: rebuilding {self.output} failed: {e}")
+            return
+        report(f"Rebuilt {self.output} in {seconds:.2f}s ({reason})")
+
+
+def _all_files(watched: Dict[str, List[Path]]) -> List[Path]:
+    return [path for paths in watched.values() for path in paths]
@@ -0,0 +1,20 @@
+class FakePage:
+    """Laid out page of a WeasyPrint document, with only its anchors."""
+
+    def __init__(self, anchors: dict):
+        self.anchors = anchors
+
+    @property
+    def _page_box(self):
+        raise AssertionError("the boxes of a page should not be walked")
+
+
+class FakeDocument:
+    """Laid out WeasyPrint document, with the html it was laid out from."""
+
+    def __init__(self, pages: list, html: str = ""):
+        self.pages = pages
+        self.html = html
+
+    def copy(self, pages):
+        return FakeDocument(list(pages))
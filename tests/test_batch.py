@@ -0,0 +1,108 @@
+import mdexport.batch
+from mdexport.batch import (
+    DuplicateOutputException,
+    _publish_job,
+    collect_md_files,
+    publish_batch,
+)
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from pytest import MonkeyPatch, raises
+from pathlib import Path
+
+
+def test_collect_md_files(tmp_path: Path):
+    notes = tmp_path / "notes"
+    (notes / "sub").mkdir(parents=True)
+    (notes / "note1.md").touch()
+    (notes / "sub" / "note2.md").touch()
+    (notes / "image.png").touch()
+    (tmp_path / "note3.md").touch()
+    output_dir = tmp_path / "out"
+    jobs = collect_md_files([str(notes), str(tmp_path / "*.md")], output_dir)
+    assert {output for _, output in jobs} == {
+        output_dir / "note1.pdf",
+        output_dir / "sub" / "note2.pdf",
+        output_dir / "note3.pdf",
+    }
+
+
+def test_collect_md_files_no_duplicates(tmp_path: Path):
+    (tmp_path / "note.md").touch()
+    jobs = collect_md_files(
+        [str(tmp_path / "note.md"), str(tmp_path / "*.md")], tmp_path / "out"
+    )
+    assert len(jobs) == 1
+
+
+def test_collect_md_files_glob_keeps_relative_paths(tmp_path: Path):
+    for folder in ["a", "b"]:
+        (tmp_path / "notes" / folder).mkdir(parents=True)
+        (tmp_path / "notes" / folder / "index.md").touch()
+    output_dir = tmp_path / "out"
+    jobs = collect_md_files([str(tmp_path / "notes" / "**" / "*.md")], output_dir)
+    assert sorted(output for _, output in jobs) == [
+        output_dir / "a" / "index.pdf",
+        output_dir / "b" / "index.pdf",
+    ]
+
+
+def test_collect_md_files_same_output(tmp_path: Path):
+    for folder in ["a", "b"]:
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "index.md").touch()
+    with raises(DuplicateOutputException):
+        collect_md_files(
+            [str(tmp_path / "a" / "index.md"), str(tmp_path / "b" / "index.md")],
+            tmp_path / "out",
+        )
+
+
+def test_publish_job_reports_failures(monkeypatch: MonkeyPatch, tmp_path: Path):
+    def mock_publish_md_file(md_path, output, template, toc_depth, *cache_flags):
+        if md_path.name == "broken.md":
+            raise ValueError("broken note")
+        output.write_text("pdf")
+        return False
+
+    monkeypatch.setattr(mdexport.batch, "publish_md_file", mock_publish_md_file)
+    good = _publish_job(
+        tmp_path / "good.md", tmp_path / "out" / "good.pdf", None, 2, False, False
+    )
+    assert good.succeeded and good.size == 3
+    assert (tmp_path / "out" / "good.pdf").read_text() == "pdf"
+    broken = _publish_job(
+        tmp_path / "broken.md", tmp_path / "out" / "broken.pdf", None, 2, False, False
+    )
+    assert not broken.succeeded
+    assert broken.error == "broken note"
+
+
+class BrokenPoolExecutor:
+    """Process pool whose workers died before finishing any job."""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, function, *args) -> Future:
+        future = Future()
+        future.set_exception(BrokenProcessPool("a worker process died"))
+        return future
+
+
+def test_publish_batch_reports_dead_workers(monkeypatch: MonkeyPatch, tmp_path: Path):
+    monkeypatch.setattr(mdexport.batch, "ProcessPoolExecutor", BrokenPoolExecutor)
+    jobs = [
+        (tmp_path / "one.md", tmp_path / "out" / "one.pdf"),
+        (tmp_path / "two.md", tmp_path / "out" / "two.pdf"),
+    ]
+    results = list(publish_batch(jobs, None, 2, 2))
+    assert sorted(result.md_path.name for result in results) == ["one.md", "two.md"]
+    assert not any(result.succeeded for result in results)
+    assert "worker process died" in results[0].error
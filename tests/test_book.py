@@ -0,0 +1,83 @@
+import mdexport.book
+from mdexport.book import (
+    collect_chapters,
+    prefix_heading_ids,
+    publish_book,
+)
+from mdexport.markdown import parse_md_file
+from tests.fakes import FakeDocument, FakePage
+from pytest import MonkeyPatch
+from pathlib import Path
+import re
+
+
+def fake_write_render_html(template, filled_template: str) -> FakeDocument:
+    # Every heading starts a page.
+    heading_ids = re.findall(r'<h[1-6] id="([^"]+)"', filled_template)
+    pages = [FakePage({heading_id: (0, 0)}) for heading_id in heading_ids]
+    return FakeDocument(pages or [FakePage({})], filled_template)
+
+
+def test_collect_chapters(tmp_path: Path):
+    (tmp_path / "part").mkdir()
+    (tmp_path / "part" / "b.md").write_text("b")
+    (tmp_path / "part" / "a.md").write_text("a")
+    (tmp_path / "intro.md").write_text("intro")
+    assert collect_chapters([str(tmp_path / "intro.md"), str(tmp_path / "part")]) == [
+        tmp_path / "intro.md",
+        tmp_path / "part" / "a.md",
+        tmp_path / "part" / "b.md",
+    ]
+
+
+def test_prefix_heading_ids(tmp_path: Path):
+    md_path = tmp_path / "chapter.md"
+    md_path.write_text("# Intro\nSee [below](#details) or [site](https://a.b/#intro)\n## Details\n")
+    md_document = prefix_heading_ids(parse_md_file(md_path), "chapter-2-")
+    assert md_document.headers == [
+        (1, "chapter-2-intro", "Intro"),
+        (2, "chapter-2-details", "Details"),
+    ]
+    assert '<h1 id="chapter-2-intro">' in md_document.html
+    assert 'href="#chapter-2-details"' in md_document.html
+    assert 'href="https://a.b/#intro"' in md_document.html
+
+
+def test_publish_book(monkeypatch: MonkeyPatch, tmp_path: Path):
+    written = []
+    rendered = []
+
+    def record_write_render_html(template, filled_template):
+        rendered.append(filled_template)
+        return fake_write_render_html(template, filled_template)
+
+    monkeypatch.setattr(mdexport.book, "write_render_html", record_write_render_html)
+    monkeypatch.setattr(
+        mdexport.book,
+        "write_document_to_pdf",
+        lambda document, output, template: written.append((document, output)),
+    )
+    first = tmp_path / "first.md"
+    first.write_text("# Intro\n## Details\n")
+    second = tmp_path / "second.md"
+    second.write_text("# Intro\n")
+
+    pages = publish_book([first, second], tmp_path / "book.pdf", None, 2, 1)
+
+    assert pages == 4
+    book, output = written[0]
+    assert output == tmp_path / "book.pdf"
+    toc_page = book.pages[0]
+    assert toc_page.anchors == {}
+    assert [list(page.anchors) for page in book.pages[1:]] == [
+        ["chapter-1-intro"],
+        ["chapter-1-details"],
+        ["chapter-2-intro"],
+    ]
+    # Chapters are numbered on from the previous one, the table of content
+    # lists the page of every heading in the book.
+    assert "counter-reset: page 1;" in rendered[0]
+    assert "counter-reset: page 3;" in rendered[1]
+    assert 'href="#chapter-1-details" class="mdexport-toc-item" data-page="2"' in rendered[2]
+    assert 'href="#chapter-2-intro" class="mdexport-toc-item" data-page="3"' in rendered[2]
+
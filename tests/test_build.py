@@ -0,0 +1,79 @@
+import mdexport.build
+import mdexport.cache
+import mdexport.templates
+from mdexport.build import BUILD_MANIFEST_FILENAME, plan_build, run_build
+from mdexport.batch import BatchResult
+from pytest import MonkeyPatch
+from pathlib import Path
+import os
+
+
+def fake_publish_batch(jobs, template, toc_depth, workers):
+    for md_path, output in jobs:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(md_path.read_text())
+        yield BatchResult(md_path, output, 0.1)
+
+
+def build(vault: Path, output_dir: Path):
+    plan = plan_build(vault, output_dir, "note", 2)
+    list(run_build(plan, output_dir, "note", 2, 1))
+    return plan
+
+
+def test_incremental_build(monkeypatch: MonkeyPatch, tmp_path: Path):
+    templates = tmp_path / "templates"
+    (templates / "note").mkdir(parents=True)
+    (templates / "note" / "template.html").write_text("{{body}}")
+    for module in [mdexport.build, mdexport.cache, mdexport.templates]:
+        monkeypatch.setattr(module, "get_templates_directory", lambda: templates)
+    monkeypatch.setattr(mdexport.build, "get_relevant_config", lambda: {})
+    monkeypatch.setattr(mdexport.build, "publish_batch", fake_publish_batch)
+    vault = tmp_path / "vault"
+    (vault / "area").mkdir(parents=True)
+    (vault / "imgs").mkdir()
+    (vault / "imgs" / "logo.png").write_bytes(b"logo")
+    (vault / "one.md").write_text("# One")
+    (vault / "area" / "two.md").write_text("# Two\n![logo](../imgs/logo.png)")
+    (vault / "area" / "three.md").write_text("# Three\n![scan](../imgs/scan.png)")
+    output_dir = tmp_path / "dist"
+
+    plan = build(vault, output_dir)
+    assert len(plan.dirty) == 3
+    assert (output_dir / "area" / "two.pdf").is_file()
+    assert (output_dir / BUILD_MANIFEST_FILENAME).is_file()
+
+    plan = build(vault, output_dir)
+    assert plan.dirty == [] and len(plan.unchanged) == 3
+
+    # An edited note or attachment only publishes the notes depending on it.
+    (vault / "one.md").write_text("# One edited")
+    (vault / "imgs" / "logo.png").write_bytes(b"new logo")
+    plan = build(vault, output_dir)
+    assert sorted(output.name for _, output in plan.dirty) == ["one.pdf", "two.pdf"]
+
+    # An embedded image that did not exist yet publishes its note once added.
+    (vault / "imgs" / "scan.png").write_bytes(b"scan")
+    plan = build(vault, output_dir)
+    assert [output.name for _, output in plan.dirty] == ["three.pdf"]
+
+    # Touched without changes, the content decides.
+    os.utime(vault / "one.md", ns=(0, 0))
+    plan = build(vault, output_dir)
+    assert plan.dirty == []
+
+    # A template change publishes every note.
+    (templates / "note" / "style.css").write_text("body {}")
+    plan = build(vault, output_dir)
+    assert len(plan.dirty) == 3
+
+    # The pdf of a deleted note is removed, and its empty folder.
+    (vault / "area" / "two.md").unlink()
+    (vault / "area" / "three.md").unlink()
+    plan = build(vault, output_dir)
+    assert sorted(plan.orphans) == [
+        output_dir / "area" / "three.pdf",
+        output_dir / "area" / "two.pdf",
+    ]
+    assert not (output_dir / "area").exists()
+    assert (output_dir / "one.pdf").is_file()
@@ -0,0 +1,165 @@
+import mdexport.cache
+import mdexport.templates
+from mdexport.cache import (
+    OutputCache,
+    compute_publish_digest,
+    replace_atomic,
+)
+from pytest import MonkeyPatch, raises
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import json
+import os
+
+
+def write_note(tmp_path: Path) -> Path:
+    (tmp_path / "imgs").mkdir()
+    (tmp_path / "imgs" / "logo.png").write_bytes(b"logo")
+    md_path = tmp_path / "note.md"
+    md_path.write_text("# Title\n![logo](imgs/logo.png)\n")
+    return md_path
+
+
+def test_compute_publish_digest_changes_with_inputs(
+    monkeypatch: MonkeyPatch, tmp_path: Path
+):
+    templates = tmp_path / "templates"
+    (templates / "invoice").mkdir(parents=True)
+    (templates / "invoice" / "template.html").write_text("{{body}}")
+    for module in [mdexport.cache, mdexport.templates]:
+        monkeypatch.setattr(module, "get_templates_directory", lambda: templates)
+    md_path = write_note(tmp_path)
+
+    digest = compute_publish_digest(md_path, "invoice", 2)
+    assert digest == compute_publish_digest(md_path, "invoice", 2)
+    assert digest != compute_publish_digest(md_path, "invoice", 3)
+    assert digest != compute_publish_digest(md_path, None, 2)
+
+    (tmp_path / "imgs" / "logo.png").write_bytes(b"new logo")
+    attachment_digest = compute_publish_digest(md_path, "invoice", 2)
+    assert attachment_digest != digest
+
+    (templates / "invoice" / "style.css").write_text("body {}")
+    style_digest = compute_publish_digest(md_path, "invoice", 2)
+    assert style_digest != attachment_digest
+
+    # Templates extended from another folder count too.
+    (templates / "base").mkdir()
+    (templates / "base" / "template.html").write_text(
+        "<html>{% block content %}{% endblock %}</html>"
+    )
+    (templates / "invoice" / "template.html").write_text(
+        '{% extends "base/template.html" %}{% block content %}{{body}}{% endblock %}'
+    )
+    template_file = templates / "invoice" / "template.html"
+    os.utime(template_file, ns=(0, template_file.stat().st_mtime_ns + 1_000_000))
+    extends_digest = compute_publish_digest(md_path, "invoice", 2)
+    (templates / "base" / "template.html").write_text(
+        "<html><body>{% block content %}{% endblock %}</body></html>"
+    )
+    assert compute_publish_digest(md_path, "invoice", 2) != extends_digest
+
+
+def test_output_cache_store_and_restore(tmp_path: Path):
+    output_cache = OutputCache(tmp_path / "cache", 1000)
+    output = tmp_path / "output.pdf"
+    assert not output_cache.restore("digest", output)
+    output.write_bytes(b"pdf")
+    output_cache.store("digest", output)
+    output.unlink()
+    assert output_cache.restore("digest", output)
+    assert output.read_bytes() == b"pdf"
+
+
+def test_output_cache_evicts_least_recently_used(tmp_path: Path):
+    output_cache = OutputCache(tmp_path / "cache", 10)
+    output = tmp_path / "output.pdf"
+    for digest in ["first", "second", "third"]:
+        output.unlink(missing_ok=True)
+        output.write_bytes(b"four")
+        output_cache.store(digest, output)
+    assert not output_cache.restore("first", tmp_path / "first.pdf")
+    assert output_cache.restore("second", tmp_path / "second.pdf")
+    assert output_cache.restore("third", tmp_path / "third.pdf")
+    assert not (tmp_path / "cache" / "first.pdf").exists()
+
+
+def test_output_cache_restore_is_a_separate_file(tmp_path: Path):
+    output_cache = OutputCache(tmp_path / "cache", 1000)
+    output = tmp_path / "output.pdf"
+    output.write_bytes(b"pdf")
+    output_cache.store("digest", output)
+    assert os.stat(output).st_ino != os.stat(tmp_path / "cache" / "digest.pdf").st_ino
+
+    assert output_cache.restore("digest", output)
+    assert os.stat(output).st_ino != os.stat(tmp_path / "cache" / "digest.pdf").st_ino
+    # Writing the restored output in place leaves the cache entry alone.
+    output.write_bytes(b"edited pdf")
+    assert output_cache.restore("digest", tmp_path / "restored.pdf")
+    assert (tmp_path / "restored.pdf").read_bytes() == b"pdf"
+
+
+def test_replace_atomic(tmp_path: Path):
+    path = tmp_path / "output.pdf"
+    path.write_bytes(b"old")
+    os.link(path, tmp_path / "link.pdf")
+    with replace_atomic(path) as temp_path:
+        temp_path.write_bytes(b"new")
+        assert path.read_bytes() == b"old"
+    assert path.read_bytes() == b"new"
+    assert (tmp_path / "link.pdf").read_bytes() == b"old"
+
+    with raises(RuntimeError):
+        with replace_atomic(path) as temp_path:
+            temp_path.write_bytes(b"partial")
+            raise RuntimeError("render failed")
+    assert path.read_bytes() == b"new"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["link.pdf", "output.pdf"]
+
+
+def store_entries(directory: Path, prefix: str) -> None:
+    output_cache = OutputCache(directory / "cache", 1000)
+    for index in range(20):
+        output = directory / f"{prefix}-{index}.pdf"
+        output.write_bytes(b"pdf")
+        output_cache.store(f"{prefix}-{index}", output)
+
+
+def test_output_cache_parallel_stores_keep_all_entries(tmp_path: Path):
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(store_entries, [tmp_path] * 4, ["a", "b", "c", "d"]))
+    manifest = json.loads((tmp_path / "cache" / "manifest.json").read_text())
+    assert len(manifest) == 80
+
+
+def test_output_cache_removes_entries_missing_from_manifest(tmp_path: Path):
+    output_cache = OutputCache(tmp_path / "cache", 1000)
+    (tmp_path / "cache").mkdir()
+    (tmp_path / "cache" / "lost.pdf").write_bytes(b"lost")
+    output = tmp_path / "output.pdf"
+    output.write_bytes(b"pdf")
+    output_cache.store("digest", output)
+    assert not (tmp_path / "cache" / "lost.pdf").exists()
+    assert (tmp_path / "cache" / "digest.pdf").exists()
+
+
+def test_toc_offsets(monkeypatch: MonkeyPatch, tmp_path: Path):
+    monkeypatch.setattr(mdexport.cache, "MAX_TOC_OFFSETS", 2)
+    output_cache = OutputCache(tmp_path / "cache", 1000)
+    assert output_cache.load_toc_offset(tmp_path / "a.md", "manual", 2) == 0
+    output_cache.save_toc_offset(tmp_path / "a.md", "manual", 2, 3)
+    assert output_cache.load_toc_offset(tmp_path / "a.md", "manual", 2) == 3
+    assert output_cache.load_toc_offset(tmp_path / "a.md", "manual", 3) == 0
+    assert output_cache.load_toc_offset(tmp_path / "a.md", "letter", 2) == 0
+    output_cache.save_toc_offset(tmp_path / "b.md", "manual", 2, 1)
+    output_cache.save_toc_offset(tmp_path / "c.md", "manual", 2, 1)
+    # The least recently settled offset is forgotten.
+    assert output_cache.load_toc_offset(tmp_path / "a.md", "manual", 2) == 0
+    assert output_cache.load_toc_offset(tmp_path / "c.md", "manual", 2) == 1
+
+
+def test_save_toc_offset_unwritable_cache(tmp_path: Path):
+    (tmp_path / "file").write_text("not a directory")
+    output_cache = OutputCache(tmp_path / "file" / "cache", 1000)
+    output_cache.save_toc_offset(tmp_path / "a.md", "manual", 2, 3)
+    assert output_cache.load_toc_offset(tmp_path / "a.md", "manual", 2) == 0
@@ -1,5 +1,13 @@
-from mdexport.cli import validate_template_dir
+from mdexport.cli import (
+    check_pdf_profile,
+    validate_template,
+    validate_template_dir,
+    validate_workers,
+)
+from mdexport.profiles import UnknownPdfProfileException
 from pathlib import Path
+import mdexport.profiles
+import mdexport.templates
 import pytest
 import click
 
@@ -19,3 +27,32 @@ def test_validate_template_dir_is_not_folder(tmp_path: Path):
 
 def test_validate_template_dir_valid(tmp_path: Path):
     assert validate_template_dir(None, None, str(tmp_path)) == tmp_path
+
+
+def test_validate_workers():
+    assert validate_workers(None, None, 4) == 4
+    with pytest.raises(click.BadParameter):
+        validate_workers(None, None, 0)
+
+
+
+def test_check_pdf_profile_unknown(monkeypatch: pytest.MonkeyPatch, capsys):
+    def unknown_profile(template):
+        raise UnknownPdfProfileException("Unknown pdf profile tiny")
+
+    monkeypatch.setattr(mdexport.profiles, "get_pdf_options", unknown_profile)
+    with pytest.raises(SystemExit):
+        check_pdf_profile("invoice")
+    assert capsys.readouterr().out == "ERROR: Unknown pdf profile tiny\n"
+
+
+def test_validate_template_lists_again_before_rejecting(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+):
+    (tmp_path / "letter").mkdir()
+    monkeypatch.setattr(mdexport.templates, "get_templates_directory", lambda: tmp_path)
+    monkeypatch.setattr(mdexport.templates, "_registry", None)
+    with pytest.raises(click.BadParameter):
+        validate_template(None, None, "letter")
+    (tmp_path / "letter" / "template.html").touch()
+    assert validate_template(None, None, "letter") == "letter"
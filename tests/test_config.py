@@ -1,11 +1,15 @@
 from pytest import MonkeyPatch
 from pathlib import Path
+import json
 from mdexport.config import (
     _get_config_directory,
     APP_NAME,
     CONFIG_FILENAME,
+    DEFAULT_CONFIG,
     Config,
     ConfigStructure,
+    get_config,
+    use_config,
 )
 import mdexport.config
 
@@ -25,10 +29,13 @@ def test_config_directory_unix(monkeypatch: MonkeyPatch, tmp_path: Path):
     assert config_dir == tmp_path / ".config" / APP_NAME
 
 
-def test_config_init(monkeypatch: MonkeyPatch, tmp_path: Path):
-    monkeypatch.setattr(mdexport.config, "_get_config_directory", lambda: tmp_path)
-    Config()
-    assert (tmp_path / CONFIG_FILENAME).is_file()
+def test_config_load_never_writes(monkeypatch: MonkeyPatch, tmp_path: Path):
+    config_dir = tmp_path / "config"
+    monkeypatch.setattr(mdexport.config, "_get_config_directory", lambda: config_dir)
+    config = Config()
+    config.load()
+    assert config.config == DEFAULT_CONFIG
+    assert not config_dir.exists()
 
 
 class MockConfigStructure:
@@ -51,16 +58,46 @@ def test_config_load(monkeypatch: MonkeyPatch, tmp_path: Path):
         "config2": "value2",
         "config3": "value3",
     }
+    assert "config3" not in (tmp_path / CONFIG_FILENAME).read_text()
+
+
+def test_config_environment_override(monkeypatch: MonkeyPatch, tmp_path: Path):
+    monkeypatch.setattr(mdexport.config, "_get_config_directory", lambda: tmp_path)
+    (tmp_path / CONFIG_FILENAME).write_text('{"image_dpi": "150"}')
+    monkeypatch.setenv("MDEXPORT_IMAGE_DPI", "300")
+    config = Config()
+    config.load()
+    assert config.config[ConfigStructure.IMAGE_DPI] == "300"
+    config.set(ConfigStructure.CACHE_SIZE, "100")
+    # Overrides are not written to the config file.
+    assert json.loads((tmp_path / CONFIG_FILENAME).read_text()) == {
+        "image_dpi": "150",
+        "cache_size": "100",
+    }
+    assert config.config[ConfigStructure.IMAGE_DPI] == "300"
+
+
+def test_use_config_keeps_overrides_apart(monkeypatch: MonkeyPatch):
+    monkeypatch.setattr(mdexport.config, "_config", None)
+    use_config(
+        {ConfigStructure.PDF_PROFILE: "print"}, {ConfigStructure.IMAGE_DPI: "150"}
+    )
+    config = get_config()
+    assert config.config[ConfigStructure.PDF_PROFILE] == "print"
+    assert config.config[ConfigStructure.IMAGE_DPI] == "150"
+    # Only what was overridden in the parent counts as given for this run.
+    assert config.overrides == {ConfigStructure.IMAGE_DPI: "150"}
 
 
 def test_config_save(monkeypatch: MonkeyPatch, tmp_path: Path):
     monkeypatch.setattr(mdexport.config, "_get_config_directory", lambda: tmp_path)
     config = Config()
-    config.config = {"config1": "value1", "config2": "value2", "config3": "value3"}
+    config.stored = {"config1": "value1", "config2": "value2", "config3": "value3"}
     config.save()
     assert (
         tmp_path / CONFIG_FILENAME
     ).read_text() == '{"config1": "value1", "config2": "value2", "config3": "value3"}'
+    assert [path.name for path in tmp_path.iterdir()] == [CONFIG_FILENAME]
 
 
 def test_config_set(monkeypatch: MonkeyPatch, tmp_path: Path):
@@ -73,6 +110,7 @@ def test_config_set(monkeypatch: MonkeyPatch, tmp_path: Path):
         savecalled = True
 
     monkeypatch.setattr(mdexport.config.Config, "save", mock_save)
+    monkeypatch.setattr(mdexport.config, "DEFAULT_CONFIG", {})
     config = Config()
     config.set("config1", "value2")
     assert config.config == {"config1": "value2"} and savecalled
@@ -0,0 +1,105 @@
+import mdexport.cache
+import mdexport.core
+from mdexport.cache import OutputCache
+from mdexport.core import publish_md_file, render_document
+from mdexport.markdown import MarkdownDocument
+from pytest import MonkeyPatch
+from pathlib import Path
+
+HEADERS = [(1, "intro", "Intro"), (1, "usage", "Usage")]
+
+
+def mock_layout(monkeypatch: MonkeyPatch, uses_toc: bool = True) -> list:
+    """Lay out documents whose first heading is on page 3, after a cover and a
+    table of content page. Returns the filled templates laid out."""
+    laid_out = []
+
+    def mock_write_render_html(template, filled_template):
+        laid_out.append(filled_template)
+        return f"document {len(laid_out)}"
+
+    monkeypatch.setattr(mdexport.core, "warn_missing_metadata", lambda *_: None)
+    monkeypatch.setattr(mdexport.core, "template_uses_toc", lambda _: uses_toc)
+    monkeypatch.setattr(
+        mdexport.core,
+        "fill_template",
+        lambda template, html_content, metadata: metadata.get("toc", "") + html_content,
+    )
+    monkeypatch.setattr(mdexport.core, "write_render_html", mock_write_render_html)
+    monkeypatch.setattr(
+        mdexport.core,
+        "get_heading_pages",
+        lambda document, heading_ids: {"intro": 3, "usage": 5},
+    )
+    return laid_out
+
+
+def make_document(tmp_path: Path) -> MarkdownDocument:
+    return MarkdownDocument(
+        tmp_path / "manual.md", {}, "", '<h1 id="intro">Intro</h1>', HEADERS, ""
+    )
+
+
+def test_render_document_settles_offset(monkeypatch: MonkeyPatch, tmp_path: Path):
+    laid_out = mock_layout(monkeypatch)
+    document, offset = render_document(make_document(tmp_path), "manual", 2)
+    assert (document, offset) == ("document 2", 2)
+    assert len(laid_out) == 2
+    assert "@page:nth(2)" in laid_out[1] and "@page:nth(1)" not in laid_out[0]
+
+
+def test_render_document_with_known_offset(monkeypatch: MonkeyPatch, tmp_path: Path):
+    laid_out = mock_layout(monkeypatch)
+    assert render_document(make_document(tmp_path), "manual", 2, 2) == (
+        "document 1",
+        2,
+    )
+    assert len(laid_out) == 1
+
+
+def test_render_document_without_toc(monkeypatch: MonkeyPatch, tmp_path: Path):
+    laid_out = mock_layout(monkeypatch, uses_toc=False)
+    assert render_document(make_document(tmp_path), "manual", 2) == ("document 1", 0)
+    assert render_document(make_document(tmp_path), None, 2) == ("document 2", 0)
+    assert len(laid_out) == 2
+
+
+def test_publish_md_file_reuses_settled_offset(
+    monkeypatch: MonkeyPatch, tmp_path: Path
+):
+    laid_out = mock_layout(monkeypatch)
+    md_path = tmp_path / "manual.md"
+    output = tmp_path / "manual.pdf"
+    cache_path = tmp_path / "cache"
+    monkeypatch.setattr(
+        mdexport.core, "get_output_cache", lambda: OutputCache(cache_path, 1000)
+    )
+    monkeypatch.setattr(mdexport.core, "compute_publish_digest", lambda *_: "digest")
+    monkeypatch.setattr(
+        mdexport.core, "parse_md_file", lambda _: make_document(tmp_path)
+    )
+    monkeypatch.setattr(
+        mdexport.core,
+        "write_document_to_pdf",
+        lambda document, output, template: output.write_bytes(b"pdf"),
+    )
+    publish_md_file(md_path, output, "manual", 2, use_cache=True, refresh=True)
+    assert len(laid_out) == 2
+    # The next publish starts from the offset the first one settled at.
+    publish_md_file(md_path, output, "manual", 2, use_cache=True, refresh=True)
+    assert len(laid_out) == 3
+
+
+def test_publish_md_file_without_cache_forgets_offset(
+    monkeypatch: MonkeyPatch, tmp_path: Path
+):
+    laid_out = mock_layout(monkeypatch)
+    monkeypatch.setattr(mdexport.cache, "get_cache_directory", lambda: tmp_path)
+    monkeypatch.setattr(
+        mdexport.core, "parse_md_file", lambda _: make_document(tmp_path)
+    )
+    monkeypatch.setattr(mdexport.core, "write_document_to_pdf", lambda *_: None)
+    publish_md_file(tmp_path / "manual.md", tmp_path / "manual.pdf", "manual", 2)
+    publish_md_file(tmp_path / "manual.md", tmp_path / "manual.pdf", "manual", 2)
+    assert len(laid_out) == 4
+    assert list(tmp_path.iterdir()) == []
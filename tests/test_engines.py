@@ -0,0 +1,80 @@
+from pytest import importorskip, raises
+import html
+import re
+
+from mdexport.engines import (
+    Markdown2Engine,
+    MarkdownEngine,
+    MarkdownItEngine,
+    slugify,
+)
+from mdexport.markdown import generate_toc_from_headers
+
+CONFORMANCE_MD = """# Introduction
+
+Some *text* with a [link](#details) and `code`.
+
+## Details: the 2nd part
+
+| Name | Amount |
+|------|-------:|
+| one  | 1      |
+| two  | 2      |
+
+```python
+total = 1 < 2
+```
+
+    indented code
+
+## Details: the 2nd part
+
+### Café & **bold**
+
+- first
+- second
+
+<img src="/attachments/logo.png" alt="logo.png" />
+"""
+
+
+def normalize(html_text: str) -> str:
+    """Text of the html, without tags and with collapsed whitespace."""
+    text = html.unescape(re.sub(r"<[^>]+>", " ", html_text))
+    return " ".join(text.split())
+
+
+def count_tags(html_text: str, tag: str) -> int:
+    return len(re.findall(rf"<{tag}\b", html_text))
+
+
+def test_slugify_matches_markdown2():
+    for text in ["Details: the 2nd part", "Café & **bold**", "One.a", "a - b"]:
+        md_html, headers = Markdown2Engine().convert(f"# {text}\n")
+        assert headers[0][1] == slugify(text)
+
+
+def test_markdown_it_conforms_to_markdown2():
+    importorskip("markdown_it")
+    expected_html, expected_headers = Markdown2Engine().convert(CONFORMANCE_MD)
+    html_text, headers = MarkdownItEngine().convert(CONFORMANCE_MD)
+
+    assert headers == expected_headers
+    heading_pattern = r'<h([1-6]) id="([^"]+)"'
+    assert re.findall(heading_pattern, html_text) == re.findall(
+        heading_pattern, expected_html
+    )
+    assert generate_toc_from_headers(headers, 3) == generate_toc_from_headers(
+        expected_headers, 3
+    )
+    for tag in ["table", "th", "td", "pre", "code", "li", "img", "em", "strong"]:
+        assert count_tags(html_text, tag) == count_tags(expected_html, tag), tag
+    assert normalize(html_text) == normalize(expected_html)
+
+
+def test_engine_must_implement_convert():
+    class NoConvertEngine(MarkdownEngine):
+        pass
+
+    with raises(TypeError):
+        NoConvertEngine()
@@ -1,57 +1,126 @@
 import mdexport.exporter
 from mdexport.exporter import (
-    insert_base_style,
-    write_template_to_pdf,
+    BASE_STYLE_CSS,
+    FetchCache,
+    create_html,
+    get_base_stylesheet,
+    get_base_url,
+    write_document_to_pdf,
 )
 import mdexport.templates
 from pytest import MonkeyPatch
 import mdexport
 from pathlib import Path
+import io
+import os
 
 
-def test_insert_base_style(monkeypatch: MonkeyPatch):
-    MOCK_STYLE = """
-    <style>
-    body {}
-    </style>
-"""
-    monkeypatch.setattr(mdexport.exporter, "BASE_STYLE_HTML", MOCK_STYLE)
-    MOCK_HTML = """
-<html>
-<head>
-</head>
-</html>
-"""
-    EXPECTED_HTML = """
-<html>
-<head>
-</head>
-<style>
-body {}
-</style>
-</html>
-"""
-    assert "".join(insert_base_style(MOCK_HTML).split()) == "".join(
-        EXPECTED_HTML.split()
+def test_base_stylesheet_parsed_once(monkeypatch: MonkeyPatch):
+    parsed = []
+
+    def fake_css(string, font_config):
+        parsed.append(string)
+        return object()
+
+    monkeypatch.setattr(mdexport.exporter.weasyprint, "CSS", fake_css)
+    monkeypatch.setattr(mdexport.exporter, "get_font_config", lambda: None)
+    monkeypatch.setattr(mdexport.exporter, "_base_stylesheet", None)
+    assert get_base_stylesheet() is get_base_stylesheet()
+    assert parsed == [BASE_STYLE_CSS]
+
+
+def test_create_html_keeps_html(monkeypatch: MonkeyPatch, tmp_path: Path):
+    created = []
+    monkeypatch.setattr(
+        mdexport.exporter.weasyprint, "HTML", lambda **kwargs: created.append(kwargs)
     )
+    monkeypatch.setattr(mdexport.exporter, "get_templates_directory", lambda: tmp_path)
+    create_html(None, "<h1>MOCK</h1>")
+    # The base style is a stylesheet of its own, not inserted in the html.
+    assert created[0]["string"] == "<h1>MOCK</h1>"
 
 
-def test_write_template_to_pdf(monkeypatch: MonkeyPatch, tmp_path: Path):
-    def fake_insert_base_style(html_content: str) -> str:
-        assert html_content == "<html><h1>MOCK</h1></html>"
-        return html_content
+def test_write_document_to_pdf_replaces_output(
+    monkeypatch: MonkeyPatch, tmp_path: Path
+):
+    class FakeDocument:
+        def write_pdf(self, target, **options):
+            Path(target).write_bytes(b"new pdf")
 
-    MOCK_TEMPLATE = "MOCK_TEMPLATE"
-    FILLED_TEMPLATE = "<html><h1>MOCK</h1></html>"
-    MOCK_OUTPUT = tmp_path / "output.pdf"
-    (tmp_path / MOCK_TEMPLATE).mkdir()
+    monkeypatch.setattr(mdexport.exporter, "get_pdf_options", lambda _: {})
+    output = tmp_path / "output.pdf"
+    output.write_bytes(b"old pdf")
+    os.link(output, tmp_path / "cached.pdf")
+    write_document_to_pdf(FakeDocument(), output)
+    assert output.read_bytes() == b"new pdf"
+    # A file linked to the old output is not written through.
+    assert (tmp_path / "cached.pdf").read_bytes() == b"old pdf"
+
+
+def test_get_base_url(monkeypatch: MonkeyPatch, tmp_path: Path):
     monkeypatch.setattr(
         mdexport.exporter,
         "get_templates_directory",
         lambda: tmp_path,
     )
-    monkeypatch.setattr(mdexport.exporter, "insert_base_style", fake_insert_base_style)
+    assert get_base_url("MOCK_TEMPLATE") == str(tmp_path / "MOCK_TEMPLATE")
+    assert get_base_url(None) == str(tmp_path)
+
+
+def test_fetch_cache(monkeypatch: MonkeyPatch, tmp_path: Path):
+    fetched = []
+
+    def fake_default_url_fetcher(url, timeout=10, ssl_context=None):
+        fetched.append(url)
+        if url.startswith("file:"):
+            return {"file_obj": io.BytesIO(b"logo"), "mime_type": "image/png"}
+        return {"string": b"remote", "mime_type": "image/png"}
+
+    monkeypatch.setattr(
+        mdexport.exporter.weasyprint, "default_url_fetcher", fake_default_url_fetcher
+    )
+    logo = tmp_path / "logo.png"
+    logo.write_bytes(b"logo")
+    cache = FetchCache(1024)
+
+    assert cache.fetch(logo.as_uri()) == {"string": b"logo", "mime_type": "image/png"}
+    assert cache.fetch(logo.as_uri())["string"] == b"logo"
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert len(fetched) == 1
+
+    # An edited file is fetched again.
+    logo.write_bytes(b"new logo")
+    os.utime(logo, ns=(0, 0))
+    cache.fetch(logo.as_uri())
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # Remote urls are always fetched.
+    cache.fetch("https://example.com/logo.png")
+    cache.fetch("https://example.com/logo.png")
+    assert len(fetched) == 4
+    assert cache.stats()["hits"] == 1
+
+
+def test_fetch_cache_evicts_least_recently_used(
+    monkeypatch: MonkeyPatch, tmp_path: Path
+):
     monkeypatch.setattr(
-        mdexport.exporter, "uuid4", lambda: "5e558a5b-b886-4bd3-a575-80902a967d25"
+        mdexport.exporter.weasyprint,
+        "default_url_fetcher",
+        lambda url, timeout=10, ssl_context=None: {"string": b"x" * 4},
     )
-    write_template_to_pdf(MOCK_TEMPLATE, FILLED_TEMPLATE, MOCK_OUTPUT)
+    paths = []
+    for name in ["a", "b", "c"]:
+        paths.append(tmp_path / name)
+        paths[-1].write_bytes(b"x" * 4)
+    cache = FetchCache(8)
+    cache.fetch(paths[0].as_uri())
+    cache.fetch(paths[1].as_uri())
+    cache.fetch(paths[0].as_uri())
+    cache.fetch(paths[2].as_uri())
+    assert cache.stats()["entries"] == 2
+    assert cache.size == 8
+    cache.fetch(paths[0].as_uri())
+    assert cache.hits == 2
+    cache.fetch(paths[1].as_uri())
+    assert cache.misses == 4
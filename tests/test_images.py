@@ -0,0 +1,51 @@
+import mdexport.images
+from mdexport.images import downscale_images, get_derivative
+from PIL import Image
+from pytest import MonkeyPatch
+from pathlib import Path
+
+
+def write_image(path: Path, width: int, height: int, image_format: str) -> Path:
+    Image.new("RGB", (width, height), "red").save(path, image_format)
+    return path
+
+
+def test_get_derivative_downscales_large_images(tmp_path: Path):
+    photo = write_image(tmp_path / "photo.jpg", 2000, 1000, "JPEG")
+    original_bytes = photo.read_bytes()
+    cache_dir = tmp_path / "cache"
+
+    derivative = get_derivative(photo, 100, cache_dir)
+    assert derivative.parent == cache_dir
+    assert derivative.suffix == ".jpg"
+    with Image.open(derivative) as image:
+        assert image.size == (700, 350)
+    assert photo.read_bytes() == original_bytes
+
+    # The cached derivative is reused.
+    modified = derivative.stat().st_mtime_ns
+    assert get_derivative(photo, 100, cache_dir) == derivative
+    assert derivative.stat().st_mtime_ns == modified
+    assert get_derivative(photo, 200, cache_dir) != derivative
+
+
+def test_get_derivative_keeps_small_images(tmp_path: Path):
+    icon = write_image(tmp_path / "icon.png", 300, 300, "PNG")
+    assert get_derivative(icon, 100, tmp_path / "cache") == icon
+    not_an_image = tmp_path / "notes.png"
+    not_an_image.write_text("not an image")
+    assert get_derivative(not_an_image, 100, tmp_path / "cache") == not_an_image
+
+
+def test_downscale_images(monkeypatch: MonkeyPatch, tmp_path: Path):
+    monkeypatch.setattr(mdexport.images, "get_cache_directory", lambda: tmp_path)
+    photo = write_image(tmp_path / "photo.png", 1000, 500, "PNG")
+    html = (
+        f'<p><img src="{photo}" alt="photo" />'
+        '<img src="https://example.com/logo.png" alt="logo" />'
+        f'<img src="{tmp_path / "missing.png"}" alt="missing" /></p>'
+    )
+    downscaled = downscale_images(html, 100)
+    derivative = get_derivative(photo, 100, tmp_path / "images")
+    assert derivative != photo
+    assert downscaled == html.replace(str(photo), str(derivative))
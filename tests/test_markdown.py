@@ -1,14 +1,23 @@
 from pathlib import Path
+from datetime import date
+from pytest import MonkeyPatch
+from mdexport.config import get_attachment_dir
+import mdexport.markdown
 from mdexport.markdown import (
     extract_md_metadata,
     read_md_file,
     convert_md_to_html,
     get_base_path,
-    md_relative_img_to_absolute,
-    embed_to_img_tag,
-    ATTACHMENT_DIRECTORY,
+    preprocess_md,
+    Preprocessor,
     convert_metadata_to_html,
+    convert_metadata,
+    generate_toc,
+    get_toc_offset,
+    get_heading_pages,
+    parse_md_file,
 )
+from tests.fakes import FakeDocument, FakePage
 
 
 def test_extract_md_metadata(tmp_path: Path):
@@ -56,14 +65,15 @@ def test_convert_md_to_html():
 
 
 def test_get_base_path():
-    assert get_base_path(Path("/")) == Path("/") / ATTACHMENT_DIRECTORY
+    assert get_base_path(Path("/")) == Path("/") / get_attachment_dir()
 
 
-def test_embed_to_img_tag():
+def test_preprocess_md_embed():
     MOCK_MD = "![[test.jpg]]"
+    base_path = get_base_path(Path("/mock/path/note.md"))
     assert (
-        embed_to_img_tag(MOCK_MD, Path("/mock/path"))
-        == '<img src="/mock/path/test.jpg" alt="test.jpg" />'
+        preprocess_md(MOCK_MD, Path("/mock/path/note.md"))
+        == f'<img src="{base_path}/test.jpg" alt="test.jpg" />'
     )
 
 
@@ -72,21 +82,168 @@ def test_convert_metadata_to_html_no_surounding_p():
     html = convert_metadata_to_html(metadata)
     assert not html.startswith("<p>") and not html.endswith("</p>\n")
 
-def test_md_relative_img_to_absolute():
+
+def test_convert_metadata_matches_markdown2():
+    values = [
+        "ACME & Sons",
+        "Jean-Luc <Picard>",
+        "2024-01-31",
+        "**bold** and _italic_",
+        "- first\n- second",
+        "# Heading",
+        "a | b\n--|--\n1 | 2",
+        "```\nunclosed code",
+        "&copy; 2024",
+        "",
+        "plain text",
+    ]
+    metadata = {f"key{index}": value for index, value in enumerate(values)}
+    assert convert_metadata(metadata) == {
+        key: convert_metadata_to_html(value) for key, value in metadata.items()
+    }
+    # Without a value that swallows a separator, the other values are batched.
+    values.remove("```\nunclosed code")
+    values += ["[see][1]", "[1]: http://x.com", "# Heading", "Title\n====="]
+    metadata = {f"key{index}": value for index, value in enumerate(values)}
+    assert convert_metadata(metadata) == {
+        key: convert_metadata_to_html(value) for key, value in metadata.items()
+    }
+
+
+def test_convert_metadata_non_string_values():
+    metadata = {
+        "amount": 12.5,
+        "paid": False,
+        "due": date(2024, 1, 31),
+        "empty": None,
+        "items": ["*one*", "two", 3],
+        "client": {"name": "ACME & Sons"},
+    }
+    assert convert_metadata(metadata) == {
+        "amount": 12.5,
+        "paid": False,
+        "due": date(2024, 1, 31),
+        "empty": "",
+        "items": ["<em>one</em>", "two", 3],
+        "client": {"name": "ACME &amp; Sons"},
+    }
+
+def test_preprocess_md_relative_image():
     md_content = "![Alan Turing](imgs/alan.jpg)"
     md_path = Path("/path/to/test.md")
-    result = md_relative_img_to_absolute(md_content, md_path)
+    result = preprocess_md(md_content, md_path)
     assert result == "![Alan Turing](/path/to/imgs/alan.jpg)"
 
-def test_md_relative_img_to_absolute_url():
+def test_preprocess_md_url_image():
     md_content = "![Alan Turing](http://www.website.com/imgs/alan.jpg)"
     md_path = Path("/path/to/test.md")
-    result = md_relative_img_to_absolute(md_content, md_path)
+    result = preprocess_md(md_content, md_path)
     assert result == "![Alan Turing](http://www.website.com/imgs/alan.jpg)"
 
-def test_md_relative_img_to_absolute_absolute_path_input():
+def test_preprocess_md_absolute_image():
     md_content = "![Alan Turing](/imgs/alan.jpg)"
     md_path = Path("/path/to/test.md")
-    result = md_relative_img_to_absolute(md_content, md_path)
+    result = preprocess_md(md_content, md_path)
     assert result == "![Alan Turing](/imgs/alan.jpg)"
-    
\ No newline at end of file
+
+
+def test_preprocess_md_custom_preprocessor(monkeypatch: MonkeyPatch):
+    def rewrite_highlight(match, md_path):
+        return f"<mark>{match.group(1)}</mark>"
+
+    monkeypatch.setattr(
+        mdexport.markdown,
+        "PREPROCESSORS",
+        mdexport.markdown.PREPROCESSORS + [Preprocessor(r"==(.+?)==", rewrite_highlight)],
+    )
+    md_content = "==note== ![x](imgs/x.png) and ==[link](imgs/y.png)=="
+    assert preprocess_md(md_content, Path("/path/to/test.md")) == (
+        "<mark>note</mark> ![x](/path/to/imgs/x.png) and <mark>[link](imgs/y.png)</mark>"
+    )
+
+
+def test_parse_md_file(tmp_path: Path):
+    MOCK_MD = """---
+metadata1: mockmetadata1
+---
+
+# Title1
+## Title2
+"""
+    mock_md_file = tmp_path / "mockfile.md"
+    mock_md_file.write_text(MOCK_MD)
+    md_document = parse_md_file(mock_md_file)
+    assert md_document.metadata == {"metadata1": "mockmetadata1"}
+    assert md_document.content == "# Title1\n## Title2"
+    assert md_document.html == convert_md_to_html(md_document.content, mock_md_file)
+    assert md_document.headers == [(1, "title1", "Title1"), (2, "title2", "Title2")]
+    assert 'href="#title1"' in md_document.toc_html
+
+
+def test_generate_toc_depth(tmp_path: Path):
+    MOCK_MD = """# Title1
+## Title2
+### Title3
+"""
+    mock_md_file = tmp_path / "mockfile.md"
+    mock_md_file.write_text(MOCK_MD)
+    toc_html = generate_toc(parse_md_file(mock_md_file), 2)
+    assert '<a href="#title1" class="mdexport-toc-item"><span>Title1</span></a>' in toc_html
+    assert '<a href="#title2" class="mdexport-toc-item"><span>Title2</span></a>' in toc_html
+    assert "title3" not in toc_html
+
+
+def test_generate_toc_nesting(tmp_path: Path):
+    MOCK_MD = """# First *emphasised*
+### Skipped level
+## Second
+# Third
+"""
+    mock_md_file = tmp_path / "mockfile.md"
+    mock_md_file.write_text(MOCK_MD)
+    toc_html = generate_toc(parse_md_file(mock_md_file), 6)
+    expected_toc = (
+        '<ul><li><a href="#first-emphasised" class="mdexport-toc-item">'
+        "<span>First <em>emphasised</em></span></a>"
+        '<ul><li><a href="#skipped-level" class="mdexport-toc-item">'
+        "<span>Skipped level</span></a></li></ul>"
+        '<ul><li><a href="#second" class="mdexport-toc-item">'
+        "<span>Second</span></a></li></ul></li>"
+        '<li><a href="#third" class="mdexport-toc-item">'
+        "<span>Third</span></a></li></ul>"
+    )
+    assert expected_toc in toc_html.replace("\n", "")
+
+
+def test_generate_toc_no_headings(tmp_path: Path):
+    mock_md_file = tmp_path / "mockfile.md"
+    mock_md_file.write_text("no headings")
+    assert generate_toc(parse_md_file(mock_md_file), 2) == ""
+
+
+def test_get_heading_pages_large_document():
+    # A long document: every page holds table rows with ids and one heading.
+    pages = [
+        FakePage(
+            {
+                **{f"row-{page}-{row}": (0, row) for row in range(50)},
+                f"heading-{page}": (0, 0),
+            }
+        )
+        for page in range(5000)
+    ]
+    # A heading split over two pages starts on the first one.
+    pages[10].anchors["heading-9"] = (0, 0)
+    heading_ids = [f"heading-{page}" for page in range(5000)]
+
+    heading_pages = get_heading_pages(FakeDocument(pages), heading_ids)
+    assert len(heading_pages) == 5000
+    assert heading_pages["heading-0"] == 1
+    assert heading_pages["heading-9"] == 10
+    assert heading_pages["heading-4999"] == 5000
+    assert get_heading_pages(FakeDocument(pages), ["heading-3"]) == {"heading-3": 4}
+
+
+def test_get_toc_offset():
+    assert get_toc_offset({"title1": 3, "title2": 5}) == 2
+    assert get_toc_offset({}) == 0
@@ -0,0 +1,80 @@
+from pathlib import Path
+from pytest import MonkeyPatch, raises
+
+import mdexport.profiles
+import mdexport.templates
+from mdexport.config import Config, ConfigStructure, DEFAULT_CONFIG
+from mdexport.profiles import (
+    PDF_PROFILES,
+    UnknownPdfProfileException,
+    format_pdf_report,
+    get_pdf_options,
+    get_pdf_profile,
+)
+
+
+def use_config(monkeypatch: MonkeyPatch, overrides: dict) -> Config:
+    config = Config()
+    config.overrides = overrides
+    config.config = {**DEFAULT_CONFIG, **overrides}
+    monkeypatch.setattr(mdexport.profiles, "get_config", lambda: config)
+    return config
+
+
+def test_get_pdf_profile_precedence(monkeypatch: MonkeyPatch, tmp_path: Path):
+    (tmp_path / "invoice").mkdir()
+    (tmp_path / "invoice" / "template.html").write_text(
+        '<html><head><meta name="mdexport-pdf-profile" content="screen"></head></html>'
+    )
+    (tmp_path / "letter").mkdir()
+    (tmp_path / "letter" / "template.html").write_text("<html></html>")
+    monkeypatch.setattr(mdexport.templates, "get_templates_directory", lambda: tmp_path)
+
+    config = use_config(monkeypatch, {})
+    config.config[ConfigStructure.PDF_PROFILE] = "print"
+    assert get_pdf_profile(None) == "print"
+    assert get_pdf_profile("letter") == "print"
+    assert get_pdf_profile("invoice") == "screen"
+    assert get_pdf_options("invoice") == PDF_PROFILES["screen"]
+
+    use_config(monkeypatch, {ConfigStructure.PDF_PROFILE: "archive"})
+    assert get_pdf_profile("invoice") == "archive"
+
+
+def test_get_pdf_profile_reads_template_once(
+    monkeypatch: MonkeyPatch, tmp_path: Path
+):
+    (tmp_path / "base").mkdir()
+    (tmp_path / "base" / "template.html").write_text(
+        '<html><meta name="mdexport-pdf-profile" content="print">'
+        "{% block body %}{% endblock %}</html>"
+    )
+    (tmp_path / "report").mkdir()
+    (tmp_path / "report" / "template.html").write_text(
+        '{% extends "base/template.html" %}{% block body %}{{body}}{% endblock %}'
+    )
+    monkeypatch.setattr(mdexport.templates, "get_templates_directory", lambda: tmp_path)
+    use_config(monkeypatch, {})
+    read = []
+    original_read_text = Path.read_text
+    monkeypatch.setattr(
+        Path, "read_text", lambda path: read.append(path) or original_read_text(path)
+    )
+    assert get_pdf_profile("report") == "print"
+    assert get_pdf_profile("report") == "print"
+    assert len(read) == 2
+
+
+def test_get_pdf_options_unknown_profile(monkeypatch: MonkeyPatch):
+    use_config(monkeypatch, {ConfigStructure.PDF_PROFILE: "tiny"})
+    with raises(UnknownPdfProfileException):
+        get_pdf_options(None)
+
+
+def test_format_pdf_report(monkeypatch: MonkeyPatch, tmp_path: Path):
+    use_config(monkeypatch, {})
+    output = tmp_path / "out.pdf"
+    output.write_bytes(b"0" * 2048)
+    assert format_pdf_report(output, None, 0.25) == (
+        f"Wrote {output}: 2.0 KB with the default profile, the pdf took 0.25s"
+    )
@@ -0,0 +1,96 @@
+import mdexport.config
+import mdexport.core
+import mdexport.profiles
+import mdexport.server
+from mdexport.server import (
+    DaemonException,
+    PublishRequestHandler,
+    forward_publish,
+)
+from mdexport.config import Config, get_config
+from pytest import MonkeyPatch, raises
+from pathlib import Path
+from threading import Thread
+import socketserver
+
+
+def test_forward_publish_no_daemon(monkeypatch: MonkeyPatch, tmp_path: Path):
+    monkeypatch.setattr(mdexport.server, "get_socket_path", lambda: tmp_path / "sock")
+    assert forward_publish(tmp_path / "a.md", tmp_path / "a.pdf", None, 2) is None
+
+
+def test_forward_publish_stale_socket(monkeypatch: MonkeyPatch, tmp_path: Path):
+    (tmp_path / "sock").touch()
+    monkeypatch.setattr(mdexport.server, "get_socket_path", lambda: tmp_path / "sock")
+    assert forward_publish(tmp_path / "a.md", tmp_path / "a.pdf", None, 2) is None
+
+
+def test_forward_publish_to_daemon(monkeypatch: MonkeyPatch, tmp_path: Path):
+    published = []
+
+    def mock_publish_md_file(md_path, output, template, toc_depth, *cache_flags):
+        if md_path.name == "broken.md":
+            raise ValueError("broken note")
+        if md_path.name == "exits.md":
+            print("ERROR: Template directory not set.")
+            exit()
+        print("published")
+        published.append(
+            (md_path, output, template, toc_depth, get_config().config["image_dpi"])
+        )
+
+    socket_path = tmp_path / "sock"
+    client_config = Config()
+    client_config.stored = {"image_dpi": "150"}
+    client_config.overrides = {"pdf_profile": "draft"}
+    client_config._merge()
+    monkeypatch.setattr(mdexport.server, "get_config", lambda: client_config)
+    # The handler switches the options of this process to those of the job.
+    monkeypatch.setattr(mdexport.config, "_config", None)
+    monkeypatch.setattr(mdexport.core, "publish_md_file", mock_publish_md_file)
+    monkeypatch.setattr(
+        mdexport.profiles,
+        "format_pdf_report",
+        lambda output, template, seconds: f"wrote {output.name}",
+    )
+    monkeypatch.setattr(mdexport.server, "get_socket_path", lambda: socket_path)
+    with socketserver.UnixStreamServer(str(socket_path), PublishRequestHandler) as server:
+        Thread(target=server.serve_forever, daemon=True).start()
+        messages = forward_publish(tmp_path / "a.md", tmp_path / "a.pdf", "invoice", 3)
+        with raises(DaemonException):
+            forward_publish(tmp_path / "broken.md", tmp_path / "a.pdf", None, 3)
+        # A publish calling exit() fails without stopping the daemon.
+        with raises(DaemonException, match="Template directory not set"):
+            forward_publish(tmp_path / "exits.md", tmp_path / "a.pdf", None, 3)
+        assert forward_publish(tmp_path / "a.md", tmp_path / "a.pdf", None, 3)
+        server.shutdown()
+    assert messages == "published\nwrote a.pdf\n"
+    assert published[0] == (tmp_path / "a.md", tmp_path / "a.pdf", "invoice", 3, "150")
+    assert get_config().overrides == {"pdf_profile": "draft"}
+
+
+def test_forward_publish_daemon_stops(monkeypatch: MonkeyPatch, tmp_path: Path):
+    class ClosingHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            self.rfile.readline()
+
+    socket_path = tmp_path / "sock"
+    monkeypatch.setattr(mdexport.server, "get_socket_path", lambda: socket_path)
+    with socketserver.UnixStreamServer(str(socket_path), ClosingHandler) as server:
+        Thread(target=server.serve_forever, daemon=True).start()
+        with raises(DaemonException, match="stopped while publishing"):
+            forward_publish(tmp_path / "a.md", tmp_path / "a.pdf", None, 2)
+        server.shutdown()
+
+
+def test_forward_publish_socket_of_other_user(monkeypatch: MonkeyPatch, tmp_path: Path):
+    socket_path = tmp_path / "sock"
+    monkeypatch.setattr(mdexport.server, "get_socket_path", lambda: socket_path)
+    with socketserver.UnixStreamServer(
+        str(socket_path), socketserver.StreamRequestHandler
+    ):
+        monkeypatch.setattr(
+            mdexport.server.os, "getuid", lambda: socket_path.lstat().st_uid + 1
+        )
+        with raises(DaemonException, match="belongs to another user"):
+            forward_publish(tmp_path / "a.md", tmp_path / "a.pdf", None, 2)
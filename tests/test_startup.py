@@ -0,0 +1,70 @@
+from pathlib import Path
+from time import perf_counter
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ["weasyprint", "markdown2", "frontmatter", "jinja2"]
+# Seconds `mdexport --help` may take on top of a bare interpreter start.
+HELP_STARTUP_BUDGET = 0.5
+
+
+def run_python(code: str, home: Path) -> str:
+    env = {**os.environ, "HOME": str(home), "XDG_CACHE_HOME": str(home / "cache")}
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parent.parent,
+    )
+    return result.stdout.strip()
+
+
+def test_import_does_not_load_rendering_modules(tmp_path: Path):
+    loaded = run_python(
+        "import sys, mdexport.mdexport\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))",
+        tmp_path,
+    )
+    assert loaded == ""
+
+
+def test_validate_template_does_not_load_rendering_modules(tmp_path: Path):
+    (tmp_path / "templates" / "invoice").mkdir(parents=True)
+    (tmp_path / "templates" / "invoice" / "template.html").touch()
+    loaded = run_python(
+        "import os, sys\n"
+        f"os.environ['MDEXPORT_TEMPLATE_DIR'] = {str(tmp_path / 'templates')!r}\n"
+        "from mdexport.cli import validate_template\n"
+        "validate_template(None, None, 'invoice')\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))",
+        tmp_path,
+    )
+    assert loaded == ""
+
+
+def test_import_has_no_filesystem_side_effects(tmp_path: Path):
+    run_python("import mdexport.mdexport", tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_help_startup_time(tmp_path: Path):
+    def best_of_three(code: str) -> float:
+        timings = []
+        for _ in range(3):
+            start = perf_counter()
+            run_python(code, tmp_path)
+            timings.append(perf_counter() - start)
+        return min(timings)
+
+    interpreter = best_of_three("pass")
+    help_command = best_of_three(
+        "from mdexport.mdexport import cli\n"
+        "try:\n"
+        "    cli(['--help'])\n"
+        "except SystemExit:\n"
+        "    pass"
+    )
+    assert help_command - interpreter < HELP_STARTUP_BUDGET
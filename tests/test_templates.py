@@ -1,6 +1,7 @@
 import mdexport.mdexport
 from pytest import MonkeyPatch, raises
 from pathlib import Path
+import os
 
 from mdexport.templates import (
     extract_variables,
@@ -8,8 +9,11 @@ from mdexport.templates import (
     read_template,
     fill_template,
     match_metadata_to_template,
+    get_template_variables,
+    template_uses_toc,
     ExpectedMoreMetaDataException,
     BODY_VAR,
+    TemplateRegistry,
 )
 
 import mdexport
@@ -46,30 +50,82 @@ def test_extract_variables():
     assert extract_variables(DUMMY_HTML_TEMPLATE) == {"var1", "body"}
 
 
-def test_fill_template(monkeypatch: MonkeyPatch):
+def test_fill_template(monkeypatch: MonkeyPatch, tmp_path: Path):
     metadata = {"metadata1": "mock_metadata"}
-    monkeypatch.setattr(
-        mdexport.templates,
-        "read_template",
-        lambda _: "<html><header>{{metadata1}}</header><body>{{body}}</body></html>",
+    (tmp_path / "mock_template").mkdir()
+    (tmp_path / "mock_template" / "template.html").write_text(
+        "<html><header>{{metadata1}}</header><body>{{body}}</body></html>"
     )
-    body = "mock_body"
+    monkeypatch.setattr(mdexport.templates, "get_templates_directory", lambda: tmp_path)
     assert (
         fill_template("mock_template", "mock_body", metadata)
         == "<html><header>mock_metadata</header><body>mock_body</body></html>"
     )
 
 
-def test_match_metadata_to_template(monkeypatch: MonkeyPatch):
-    monkeypatch.setattr(
-        mdexport.templates,
-        "read_template",
-        lambda _: "",
+def test_fill_template_include(monkeypatch: MonkeyPatch, tmp_path: Path):
+    (tmp_path / "base").mkdir()
+    (tmp_path / "base" / "template.html").write_text(
+        "<html>{% block content %}{% endblock %}</html>"
+    )
+    (tmp_path / "child").mkdir()
+    (tmp_path / "child" / "template.html").write_text(
+        '{% extends "base/template.html" %}{% block content %}{{body}}{% endblock %}'
+    )
+    monkeypatch.setattr(mdexport.templates, "get_templates_directory", lambda: tmp_path)
+    assert fill_template("child", "mock_body") == "<html>mock_body</html>"
+
+
+def test_get_template_variables_reloads_changed_template(
+    monkeypatch: MonkeyPatch, tmp_path: Path
+):
+    template_file = tmp_path / "mock_template" / "template.html"
+    template_file.parent.mkdir()
+    template_file.write_text("{{var1}}{{body}}")
+    monkeypatch.setattr(mdexport.templates, "get_templates_directory", lambda: tmp_path)
+    assert get_template_variables("mock_template") == {"var1", "body"}
+    template_file.write_text("{{var2}}{{body}}")
+    os.utime(template_file, ns=(0, template_file.stat().st_mtime_ns + 1_000_000))
+    assert get_template_variables("mock_template") == {"var2", "body"}
+
+
+def test_get_template_variables_follows_extends_and_include(
+    monkeypatch: MonkeyPatch, tmp_path: Path
+):
+    (tmp_path / "base").mkdir()
+    (tmp_path / "base" / "template.html").write_text(
+        '<html>{{toc}}{% include "base/header.html" %}{% block content %}{% endblock %}</html>'
+    )
+    (tmp_path / "base" / "header.html").write_text("{{author}}")
+    (tmp_path / "child").mkdir()
+    (tmp_path / "child" / "template.html").write_text(
+        '{% extends "base/template.html" %}{% block content %}{{title}}{{body}}{% endblock %}'
     )
+    monkeypatch.setattr(mdexport.templates, "get_templates_directory", lambda: tmp_path)
+    assert get_template_variables("child") == {"toc", "author", "title", "body"}
+    assert template_uses_toc("child")
+    assert TemplateRegistry(tmp_path).template_files("child") == [
+        "child/template.html",
+        "base/template.html",
+        "base/header.html",
+    ]
+
+
+def test_template_files_with_computed_name(tmp_path: Path):
+    (tmp_path / "child").mkdir()
+    (tmp_path / "child" / "template.html").write_text(
+        "{% include layout %}{% include 'child/missing.html' ignore missing %}"
+    )
+    registry = TemplateRegistry(tmp_path)
+    assert registry.template_files("child") is None
+    assert registry.variables("child") == {"layout"}
+
+
+def test_match_metadata_to_template(monkeypatch: MonkeyPatch):
     monkeypatch.setattr(
         mdexport.templates,
-        "extract_variables",
-        lambda _: ["metadata1", "metadata2", BODY_VAR],
+        "get_template_variables",
+        lambda _: {"metadata1", "metadata2", BODY_VAR},
     )
     with raises(ExpectedMoreMetaDataException):
         match_metadata_to_template("MOCK_TEMPLATE", {"metadata1": "mock_metadata"})
@@ -90,3 +146,75 @@ def test_extract_varialbes():
     </html>
 """
     assert extract_variables(MOCK_TEMPLATE_STRING) == {"variable1", "variable2", "body"}
+
+
+def test_template_uses_toc(monkeypatch: MonkeyPatch):
+    monkeypatch.setattr(
+        mdexport.templates, "get_template_variables", lambda _: {"toc", "body"}
+    )
+    assert template_uses_toc("mock_template")
+    monkeypatch.setattr(mdexport.templates, "get_template_variables", lambda _: {"body"})
+    assert not template_uses_toc("mock_template")
+
+
+def test_template_registry_lists_directory_once(
+    monkeypatch: MonkeyPatch, tmp_path: Path
+):
+    templates_dir = tmp_path / "templates"
+    (templates_dir / "template1").mkdir(parents=True)
+    (templates_dir / "template1" / "template.html").write_text("{{var1}}{{body}}")
+    registry = TemplateRegistry(templates_dir)
+    assert registry.templates() == ["template1"]
+
+    listed = []
+    original_iterdir = Path.iterdir
+    monkeypatch.setattr(
+        Path, "iterdir", lambda path: listed.append(path) or original_iterdir(path)
+    )
+    assert registry.templates() == ["template1"]
+    assert listed == []
+
+    (templates_dir / "template2").mkdir()
+    (templates_dir / "template2" / "template.html").touch()
+    os.utime(templates_dir, ns=(0, templates_dir.stat().st_mtime_ns + 1_000_000))
+    assert registry.templates() == ["template1", "template2"]
+    assert listed == [templates_dir]
+
+
+def test_template_registry_refresh(monkeypatch: MonkeyPatch, tmp_path: Path):
+    templates_dir = tmp_path / "templates"
+    (templates_dir / "draft").mkdir(parents=True)
+    (templates_dir / "letter").mkdir()
+    (templates_dir / "letter" / "template.html").touch()
+    registry = TemplateRegistry(templates_dir)
+    assert registry.templates() == ["letter"]
+
+    # Adding a template.html only changes the folder it is in, the folders are
+    # not checked on every listing.
+    (templates_dir / "draft" / "template.html").touch()
+    stats = []
+    original_stat = Path.stat
+    monkeypatch.setattr(
+        Path,
+        "stat",
+        lambda path, **kwargs: stats.append(path) or original_stat(path, **kwargs),
+    )
+    assert registry.templates() == ["letter"]
+    assert stats == [templates_dir]
+    assert registry.templates(refresh=True) == ["draft", "letter"]
+
+
+def test_template_registry_persists(tmp_path: Path):
+    templates_dir = tmp_path / "templates"
+    (templates_dir / "template1").mkdir(parents=True)
+    (templates_dir / "template1" / "template.html").write_text("{{var1}}{{body}}")
+    persist_path = tmp_path / "templates.json"
+    registry = TemplateRegistry(templates_dir, persist_path)
+    registry.templates()
+    registry.variables("template1")
+
+    stored = TemplateRegistry(templates_dir, persist_path)
+    assert stored._templates == ["template1"]
+    assert stored.variables("template1") == {"var1", "body"}
+    # A registry stored for another template directory is not used.
+    assert TemplateRegistry(tmp_path, persist_path)._templates == []
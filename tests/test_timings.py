@@ -0,0 +1,45 @@
+import mdexport.timings
+from mdexport.timings import (
+    format_timings,
+    get_timings,
+    reset_timings,
+    stage,
+    timed,
+)
+from pytest import MonkeyPatch
+import pytest
+
+
+def test_stages_add_up_calls_and_time(monkeypatch: MonkeyPatch):
+    clock = iter([0.0, 1.0, 1.0, 1.5, 2.0, 4.0])
+    monkeypatch.setattr(mdexport.timings, "perf_counter", lambda: next(clock))
+    reset_timings()
+
+    @timed("markdown")
+    def convert(text):
+        return text.upper()
+
+    assert convert("a") == "A"
+    assert convert("b") == "B"
+    with pytest.raises(ValueError):
+        with stage("layout"):
+            raise ValueError()
+
+    assert get_timings() == {
+        "markdown": {"seconds": 1.5, "calls": 2},
+        "layout": {"seconds": 2.0, "calls": 1},
+    }
+    reset_timings()
+    assert get_timings() == {}
+
+
+def test_format_timings():
+    timings = {
+        "markdown": {"seconds": 1.5, "calls": 2},
+        "table of content": {"seconds": 0.25, "calls": 1},
+    }
+    assert format_timings(timings, 2.0).splitlines() == [
+        "markdown             1.500s     2x",
+        "table of content     0.250s     1x",
+        "total                2.000s",
+    ]
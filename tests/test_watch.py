@@ -0,0 +1,62 @@
+import mdexport.watch
+import mdexport.templates
+from mdexport.watch import NoteWatcher, snapshot, ATTACHMENTS, NOTE, TEMPLATE
+from pytest import MonkeyPatch
+from pathlib import Path
+
+
+def test_snapshot(tmp_path: Path):
+    existing = tmp_path / "existing.md"
+    existing.write_text("content")
+    state = snapshot([existing, tmp_path / "missing.md"])
+    assert state[existing][1] == len("content")
+    assert state[tmp_path / "missing.md"] is None
+
+
+def test_watched_files(monkeypatch: MonkeyPatch, tmp_path: Path):
+    template_path = tmp_path / "templates" / "invoice"
+    template_path.mkdir(parents=True)
+    (template_path / "template.html").write_text(
+        '{% include "base/header.html" %}{{body}}'
+    )
+    (tmp_path / "templates" / "base").mkdir()
+    (tmp_path / "templates" / "base" / "header.html").write_text("<h1>Invoice</h1>")
+    (tmp_path / "logo.png").write_bytes(b"logo")
+    md_path = tmp_path / "note.md"
+    md_path.write_text("![logo](logo.png) ![scan](scan.png)")
+    for module in [mdexport.watch, mdexport.templates]:
+        monkeypatch.setattr(
+            module, "get_templates_directory", lambda: tmp_path / "templates"
+        )
+    watcher = NoteWatcher(md_path, tmp_path / "note.pdf", "invoice", 2)
+    watcher.md_document = mdexport.watch.parse_md_file(md_path)
+    watched = watcher.watched_files()
+    assert watched[NOTE] == [md_path]
+    assert watched[ATTACHMENTS] == [tmp_path / "logo.png", tmp_path / "scan.png"]
+    assert watched[TEMPLATE] == [
+        template_path,
+        template_path / "template.html",
+        tmp_path / "templates" / "base" / "header.html",
+    ]
+
+
+def test_rebuild_reuses_parsed_note_and_offset(monkeypatch: MonkeyPatch, tmp_path: Path):
+    parsed = []
+    offsets = []
+
+    def mock_parse_md_file(md_path):
+        parsed.append(md_path)
+        return "parsed note"
+
+    def mock_render_document(md_document, template, toc_depth, offset):
+        offsets.append(offset)
+        return "rendered document", 2
+
+    monkeypatch.setattr(mdexport.watch, "parse_md_file", mock_parse_md_file)
+    monkeypatch.setattr(mdexport.watch, "render_document", mock_render_document)
+    monkeypatch.setattr(mdexport.watch, "write_document_to_pdf", lambda *_: None)
+    watcher = NoteWatcher(tmp_path / "note.md", tmp_path / "note.pdf", None, 2)
+    watcher.rebuild(True)
+    watcher.rebuild(False)
+    assert parsed == [tmp_path / "note.md"]
+    assert offsets == [0, 2]